@@ -14,35 +14,24 @@ def _():
 
 @app.cell
 def _():
-    import json
+    from report_annotations import ReportAnnotationStore
 
-    with open('data/processed/research_reports_2025-06-16_17-13-29.json', encoding="utf-8") as f:
-        examples = json.load(f)
+    # отчёты импортируются в data/annotations/report_annotations.sqlite один раз, дальше читаются оттуда по одному
+    store = ReportAnnotationStore()
+    store.import_json('data/processed/research_reports_2025-06-16_17-13-29.json')
+    examples = store.examples()
     examples[0]
-    return (examples,)
+    return examples, store
 
 
 @app.cell
-def _(examples):
+def _(examples, store):
     from molabel import SimpleLabel
-    from IPython.display import HTML
-    import markdown
 
-
-    from markdown.extensions.tables import TableExtension
-
-    def render_example(example):
-        # Используем расширение для таблиц
-        html = markdown.markdown(
-            "**Вопрос: **" + example['inputs']['task']['query'] + '\n\n\n**Отчет:**\n\n' + example['outputs']['report'], 
-            extensions=[TableExtension()]
-        )
-        return html
-
-    # Create annotation widget
+    # Create annotation widget: HTML отчёта кэшируется по его хэшу, markdown рендерится один раз
     widget = SimpleLabel(
         examples=examples,
-        render=render_example,
+        render=store.render,
         notes=True
     )
 
@@ -59,27 +48,24 @@ def _(widget):
     return
 
 
-@app.cell
-def _():
-    import pickle
-    return (pickle,)
-
-
 @app.cell
 def _(mo):
     mo.md(
         r"""
-    with open('data/annotations/annotations_2025-07-03.pkl', 'wb') as file:
-        pickle.dump(annotations, file)
+    store.save_annotations(annotations, examples)
     """
     )
     return
 
 
 @app.cell
-def _(pickle):
-    with open('data/annotations/annotations_2025-07-03.pkl', 'rb') as file_:
-        annotations_ = pickle.load(file_)
+def _(examples, store):
+    import os
+
+    # старая разметка из pkl переносится в базу при первом запуске
+    if not store.load_annotations() and os.path.exists('data/annotations/annotations_2025-07-03.pkl'):
+        store.import_pickle('data/annotations/annotations_2025-07-03.pkl', examples)
+    annotations_ = store.load_annotations(with_examples=True)
     annotations_[0]
     return (annotations_,)
 
@@ -107,21 +93,13 @@ def _(mo):
 
 @app.cell
 def _():
-    from bertopic.backend import BaseEmbedder
     from langchain_gigachat.embeddings import GigaChatEmbeddings
 
-    class CustomEmbedder(BaseEmbedder):
-        def __init__(self, embedding_model):
-            super().__init__()
-            self.embedding_model = embedding_model
-
-        def embed(self, documents, verbose=False):
-            embeddings = self.embedding_model.embed_documents(documents)
-            return embeddings 
+    from error_clustering.embeddings import CustomEmbedder
 
-    # Create custom backend
+    # Create custom backend: эмбеддинги кэшируются в data/interim/embeddings, в API уходят только новые заметки
     emb_m = GigaChatEmbeddings(model="EmbeddingsGigaR", verify_ssl_certs=False)
-    custom_embedder = CustomEmbedder(embedding_model=emb_m)
+    custom_embedder = CustomEmbedder(embedding_model=emb_m, batch_size=32, concurrency=4)
     return (custom_embedder,)
 
 
@@ -152,18 +130,23 @@ def _():
 @app.cell
 def _(custom_embedder, errors, hdbscan_model, umap_model):
     from bertopic import BERTopic
-    import numpy as np
-
-    topic_model = BERTopic(embedding_model=custom_embedder, calculate_probabilities=True, verbose=True, hdbscan_model=hdbscan_model, umap_model=umap_model)
-    embeddings = custom_embedder.embed(errors)
-    embeddings = np.array(embeddings)
-    return embeddings, topic_model
 
-
-@app.cell
-def _(embeddings, errors, topic_model):
-    topics, probs = topic_model.fit_transform(errors, embeddings)
-    return
+    from error_clustering.topics import TOPICS_PATH, IncrementalTopics
+
+    def make_topic_model():
+        return BERTopic(embedding_model=custom_embedder, calculate_probabilities=True, verbose=True, hdbscan_model=hdbscan_model, umap_model=umap_model)
+
+    topics_index = IncrementalTopics(make_topic_model, custom_embedder)
+    if (TOPICS_PATH / "notes.json").exists():
+        # новые заметки распределяются по готовым темам, модель переобучается, только если выбросов стало много
+        topics_index.load()
+        known_notes = set(topics_index.docs)
+        topics_index.update([error for error in errors if error not in known_notes])
+    else:
+        topics_index.fit(errors)
+    topics_index.save()
+    topic_model = topics_index.topic_model
+    return (topic_model,)
 
 
 @app.cell
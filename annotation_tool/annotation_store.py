@@ -0,0 +1,86 @@
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+from datetime import datetime
+from pathlib import Path
+
+ANNOTATIONS_DB = Path('data/annotations/trace_annotations.sqlite')
+ANNOTATIONS_JSON = Path('data/annotations/trace_annotations.json')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS annotations (
+    node_id TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+"""
+
+
+class AnnotationStore:
+    """Разметка нод в SQLite (WAL): каждое изменение пишет только одну ноду.
+
+    Несколько разметчиков могут работать с одной базой, не затирая друг друга.
+    trace_annotations.json остаётся форматом экспорта: он пересобирается раз в
+    compact_every изменений и по кнопке сохранения, а при первом запуске из него импортируется разметка.
+    """
+
+    def __init__(self, db_path=ANNOTATIONS_DB, json_path=ANNOTATIONS_JSON, compact_every=200):
+        self.db_path = Path(db_path)
+        self.json_path = Path(json_path)
+        self.compact_every = compact_every
+        self._writes = 0
+        self._lock = threading.Lock()
+
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        is_new = not self.db_path.exists()
+        self.conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        if is_new and self.json_path.exists():
+            with open(self.json_path, 'r', encoding='utf-8') as f:
+                self.save_many(json.load(f))
+
+    def load(self):
+        with self._lock:
+            rows = self.conn.execute("SELECT node_id, data FROM annotations").fetchall()
+        return {node_id: json.loads(data) for node_id, data in rows}
+
+    def save(self, node_id, annotation):
+        self.save_many({node_id: annotation})
+
+    def save_many(self, annotations):
+        now = datetime.now().isoformat()
+        rows = [(node_id, json.dumps(a, ensure_ascii=False), now) for node_id, a in annotations.items()]
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "INSERT INTO annotations (node_id, data, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(node_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                rows,
+            )
+            self._writes += len(rows)
+            compact = self._writes >= self.compact_every
+        if compact:
+            self.compact()
+
+    def compact(self):
+        # экспорт в JSON и перенос WAL в основной файл базы
+        self.export_json()
+        with self._lock:
+            self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self._writes = 0
+
+    def export_json(self, path=None):
+        path = Path(path or self.json_path)
+        # у каждого процесса свой временный файл, чтобы одновременные экспорты разных разметчиков не смешивались
+        with tempfile.NamedTemporaryFile(
+            'w', encoding='utf-8', dir=path.parent, prefix=path.name + '.', suffix='.tmp', delete=False
+        ) as f:
+            try:
+                json.dump(self.load(), f, ensure_ascii=False, indent=2)
+            except BaseException:
+                f.close()
+                os.unlink(f.name)
+                raise
+        os.replace(f.name, path)
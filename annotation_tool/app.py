@@ -1,10 +1,17 @@
 import json
 import os
+import sqlite3
 from datetime import datetime
 
+import numpy as np
 import pandas as pd
 import streamlit as st
 
+from annotation_store import AnnotationStore
+from search_index import open_search_index
+from span_store import SpanStore, convert_spans
+from span_tree import build_span_tree
+
 st.set_page_config(
     page_title="Annotation Tool",
     page_icon="🌳",
@@ -13,46 +20,48 @@ st.set_page_config(
 )
 
 
-@st.cache_data
-def load_data():
-    df = pd.read_csv('data/processed/spans_df_20250716.csv')
-    return df
+SPANS_PATH = 'data/processed/spans_df_20250716.arrow'
+SEARCH_LIMIT = 100
+
+
+@st.cache_resource
+def load_data(path=SPANS_PATH):
+    # при первом запуске CSV из ноутбука 04 конвертируется в Arrow рядом с ним
+    if not os.path.exists(path):
+        convert_spans(os.path.splitext(path)[0] + '.csv', path)
+    return SpanStore(path)
+
+
+@st.cache_resource
+def load_tree(path=SPANS_PATH):
+    # индекс дерева строится один раз на файл с данными, из памяти читаются только колонки дерева
+    return build_span_tree(load_data(path).tree_frame())
+
+
+@st.cache_resource
+def load_search_index(path=SPANS_PATH):
+    # FTS5 индекс строится один раз и лежит рядом с файлом спанов
+    return open_search_index(path, load_data(path), load_tree(path), get_default_attributes)
+
+
+@st.cache_resource
+def get_annotation_store():
+    return AnnotationStore()
 
 
 def load_annotations():
-    if os.path.exists('data/annotations/trace_annotations.json'):
-        with open('data/annotations/trace_annotations.json', 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return {}
-
-
-def save_annotations(annotations):
-    with open('data/annotations/trace_annotations.json', 'w', encoding='utf-8') as f:
-        json.dump(annotations, f, ensure_ascii=False, indent=2)
-
-
-def build_tree(df):
-    nodes = {}
-    for _, row in df.iterrows():
-        node_id = row['context.span_id']
-        nodes[node_id] = {
-            'id': node_id,
-            'name': row['name'],
-            'span_kind': row['span_kind'],
-            'parent_id': row['parent_id'],
-            'children': [],
-            'data': row.to_dict()
-        }
+    return get_annotation_store().load()
 
-    root_nodes = []
-    for node_id, node in nodes.items():
-        parent_id = node['parent_id']
-        if pd.isna(parent_id) or parent_id not in nodes:
-            root_nodes.append(node)
-        else:
-            nodes[parent_id]['children'].append(node)
 
-    return root_nodes, nodes
+def save_annotation(annotations, node_id):
+    # пишется только изменённая нода
+    get_annotation_store().save(node_id, annotations[node_id])
+
+
+def save_annotations():
+    # изменения уже записаны по одной ноде, а словарь annotations этого запуска устарел и содержит заглушки
+    # для всех нод на экране, поэтому кнопки сохранения только пересобирают JSON и делают checkpoint базы
+    get_annotation_store().compact()
 
 
 def get_default_attributes(node):
@@ -88,7 +97,22 @@ def get_default_attributes(node):
     return default_attrs
 
 
-def display_node_with_annotation(node, annotations, depth=0, node_path=""):
+def open_node(tree, position):
+    # переход к корню трейса и разворачивание всех нод на пути к найденной
+    path = tree.path_to(position)
+    st.session_state.current_root_index = int(np.searchsorted(tree.roots, path[0]))
+    node_path = ""
+    for ancestor in path[:-1]:
+        node_id = tree.ids[ancestor]
+        st.session_state[f"children_expanded_{node_path}_{node_id}"] = True
+        node_path = f"{node_path}_{node_id}" if node_path else node_id
+    st.session_state[f"node_collapsed_{node_path}_{tree.ids[position]}"] = False
+    st.session_state.search_target = tree.ids[position]
+
+
+def display_node_with_annotation(tree, store, position, annotations, depth=0, node_path=""):
+    node = tree.node(position)
+    children = tree.children(position)
     node_id = node['id']
 
     if node_id not in annotations:
@@ -111,7 +135,8 @@ def display_node_with_annotation(node, annotations, depth=0, node_path=""):
         # Заголовок с кнопкой сворачивания
         col1, col2 = st.columns([4, 1])
         with col1:
-            st.markdown(f"{indent}### 🌿 {node['name']} ({node['span_kind']})", unsafe_allow_html=True)
+            marker = "🎯" if node_id == st.session_state.get('search_target') else "🌿"
+            st.markdown(f"{indent}### {marker} {node['name']} ({node['span_kind']})", unsafe_allow_html=True)
         with col2:
             if st.button("📦" if st.session_state[node_collapsed_key] else "📂", 
                         key=f"collapse_{node_id}", help="Свернуть/развернуть ноду"):
@@ -124,7 +149,7 @@ def display_node_with_annotation(node, annotations, depth=0, node_path=""):
         if not st.session_state[node_collapsed_key]:
             st.write(f"**ID:** {node_id}")
 
-            all_attributes = list(node['data'].keys())
+            all_attributes = store.columns
             if ('selected_attributes' not in annotations[node_id] or 
                 not annotations[node_id]['selected_attributes']):
                 default_attrs = get_default_attributes(node)
@@ -135,8 +160,7 @@ def display_node_with_annotation(node, annotations, depth=0, node_path=""):
                 f"Атрибуты для {node['name']}:",
                 all_attributes,
                 default=selected_attrs,
-                key=f"attrs_{node_id}",
-                on_change=lambda: save_annotations(annotations)
+                key=f"attrs_{node_id}"
             )
         
         # Проверяем изменения только если нода не свернута
@@ -144,14 +168,16 @@ def display_node_with_annotation(node, annotations, depth=0, node_path=""):
             if selected_attrs != annotations[node_id].get('selected_attributes', []):
                 annotations[node_id]['selected_attributes'] = selected_attrs
                 annotations[node_id]['timestamp'] = datetime.now().isoformat()
-                save_annotations(annotations)
+                save_annotation(annotations, node_id)
 
         if not st.session_state[node_collapsed_key]:
             if selected_attrs:
+                # выбранные атрибуты читаются с диска только для развёрнутой ноды
+                data = store.row(position, selected_attrs)
                 with st.expander("📋 Атрибуты", expanded=True):
                     for attr in selected_attrs:
-                        if attr in node['data'] and pd.notna(node['data'][attr]):
-                            value = node['data'][attr]
+                        if attr in data and pd.notna(data[attr]):
+                            value = data[attr]
                             if isinstance(value, str) and len(value) > 200:
                                 with st.expander(f"**{attr}:** {value[:100]}..."):
                                     st.text(value)
@@ -169,14 +195,13 @@ def display_node_with_annotation(node, annotations, depth=0, node_path=""):
                     f"Комментарий к {node['name']}:",
                     value=comment,
                     key=f"comment_{node_id}",
-                    height=100,
-                    on_change=lambda: save_annotations(annotations)
+                    height=100
                 )
             
             if comment != annotations[node_id]['comment']:
                 annotations[node_id]['comment'] = comment
                 annotations[node_id]['timestamp'] = datetime.now().isoformat()
-                save_annotations(annotations)
+                save_annotation(annotations, node_id)
 
         if not st.session_state[node_collapsed_key]:
             with st.expander("🎯 Действия и статус", expanded=True):
@@ -185,7 +210,7 @@ def display_node_with_annotation(node, annotations, depth=0, node_path=""):
                     if st.button("✅ Одобрить", key=f"yes_{node_id}"):
                         annotations[node_id]['approved'] = True
                         annotations[node_id]['timestamp'] = datetime.now().isoformat()
-                        save_annotations(annotations)
+                        save_annotation(annotations, node_id)
                         st.success("Нода одобрена!")
                         st.rerun()
 
@@ -193,7 +218,7 @@ def display_node_with_annotation(node, annotations, depth=0, node_path=""):
                     if st.button("❌ Отклонить", key=f"no_{node_id}"):
                         annotations[node_id]['approved'] = False
                         annotations[node_id]['timestamp'] = datetime.now().isoformat()
-                        save_annotations(annotations)
+                        save_annotation(annotations, node_id)
                         st.error("Нода отклонена!")
                         st.rerun()
 
@@ -201,7 +226,7 @@ def display_node_with_annotation(node, annotations, depth=0, node_path=""):
                     if st.button("🔄 Сброс", key=f"clear_{node_id}"):
                         annotations[node_id]['approved'] = None
                         annotations[node_id]['timestamp'] = datetime.now().isoformat()
-                        save_annotations(annotations)
+                        save_annotation(annotations, node_id)
                         st.info("Статус сброшен!")
                         st.rerun()
 
@@ -213,14 +238,14 @@ def display_node_with_annotation(node, annotations, depth=0, node_path=""):
                 else:
                     st.info("⏳ Статус: Не размечалось")
 
-        if node['children']:
+        if len(children):
             children_expanded_key = f"children_expanded_{node_path}_{node_id}"
             if children_expanded_key not in st.session_state:
                 st.session_state[children_expanded_key] = False  # Дочерние ноды по умолчанию свернуты
 
             col1, col2 = st.columns([3, 1])
             with col1:
-                if st.button(f"🌿 Дочерние ноды ({len(node['children'])})", 
+                if st.button(f"🌿 Дочерние ноды ({len(children)})", 
                             key=f"expand_{node_id}"):
                     st.session_state[children_expanded_key] = not st.session_state[children_expanded_key]
                     st.rerun()
@@ -228,43 +253,45 @@ def display_node_with_annotation(node, annotations, depth=0, node_path=""):
                 if st.button("📦 Все", key=f"collapse_all_{node_id}", 
                             help="Свернуть все дочерние ноды"):
                     # Сворачиваем все дочерние ноды
-                    for child in node['children']:
+                    for child_position in children:
                         child_path = f"{node_path}_{node_id}" if node_path else node_id
-                        child_collapsed_key = f"node_collapsed_{child_path}_{child['id']}"
+                        child_collapsed_key = f"node_collapsed_{child_path}_{tree.ids[child_position]}"
                         st.session_state[child_collapsed_key] = True
                     st.rerun()
 
             if st.session_state[children_expanded_key]:
                 with st.expander("📂 Дочерние ноды", expanded=True):
-                    for i, child in enumerate(node['children']):
+                    for i, child_position in enumerate(children):
                         child_path = f"{node_path}_{node_id}" if node_path else node_id
                         st.write(f"**{i+1}. Дочерняя нода:**")
-                        display_node_with_annotation(child, annotations, depth + 1, child_path)
+                        display_node_with_annotation(tree, store, child_position, annotations, depth + 1, child_path)
 
         st.divider()
 
 
-def display_root_node_with_children(root_node, all_nodes, annotations):
+def display_root_node_with_children(tree, store, root_position, annotations):
+    root_node = tree.node(root_position)
     st.header(f"🌳 Корневая нода: {root_node['name']}")
     st.write(f"**ID:** {root_node['id']}")
     st.write(f"**Тип:** {root_node['span_kind']}")
-    st.write(f"**Количество дочерних нод:** {len(root_node['children'])}")
+    st.write(f"**Количество дочерних нод:** {len(tree.children(root_position))}")
 
     st.subheader("📝 Разметка корневой ноды:")
-    display_node_with_annotation(root_node, annotations)
+    display_node_with_annotation(tree, store, root_position, annotations)
 
     if st.button("💾 Сохранить все изменения для этой ноды", type="primary"):
-        save_annotations(annotations)
+        save_annotations()
         st.success("Все изменения сохранены!")
 
 
 def main():
     st.title("🌳 Инструмент разметки нод")
 
-    df = load_data()
+    store = load_data()
     annotations = load_annotations()
 
-    root_nodes, all_nodes = build_tree(df)
+    tree = load_tree()
+    root_nodes = tree.roots
 
     if 'current_root_index' not in st.session_state:
         st.session_state.current_root_index = 0
@@ -273,7 +300,7 @@ def main():
         st.header("🧭 Навигация")
 
         st.subheader("📊 Статистика:")
-        total_nodes = len(df)
+        total_nodes = len(store)
         annotated_nodes = len([a for a in annotations.values() if a['approved'] is not None])
         approved_nodes = len([a for a in annotations.values() if a['approved'] is True])
         rejected_nodes = len([a for a in annotations.values() if a['approved'] is False])
@@ -321,32 +348,60 @@ def main():
 
         st.subheader("🔍 Фильтры:")
 
-        span_kinds = ['Все'] + list(df['span_kind'].unique())
+        span_kinds = ['Все'] + list(pd.unique(tree.span_kinds))
         span_filter = st.selectbox("Тип span:", span_kinds)
 
         search_term = st.text_input("🔍 Поиск по названию:")
 
         if span_filter != "Все" or search_term:
-            filtered_indices = []
-            for i, root in enumerate(root_nodes):
-                if span_filter != "Все" and root['span_kind'] != span_filter:
-                    continue
-                if search_term and search_term.lower() not in root['name'].lower():
-                    continue
-                filtered_indices.append(i)
-
-            if filtered_indices:
+            mask = np.ones(len(root_nodes), dtype=bool)
+            if span_filter != "Все":
+                mask &= tree.span_kinds[root_nodes] == span_filter
+            if search_term:
+                mask &= pd.Series(tree.names[root_nodes]).str.lower().str.contains(
+                    search_term.lower(), regex=False
+                ).to_numpy()
+            filtered_indices = np.flatnonzero(mask)
+
+            if len(filtered_indices):
                 st.write(f"Найдено {len(filtered_indices)} нод")
                 if st.button("Показать первую найденную"):
-                    st.session_state.current_root_index = filtered_indices[0]
+                    st.session_state.current_root_index = int(filtered_indices[0])
                     st.rerun()
             else:
                 st.warning("Нет нод, соответствующих фильтрам")
 
         st.divider()
 
+        st.subheader("🔎 Поиск по спанам:")
+        full_text_query = st.text_input(
+            "Текст в названии или атрибутах:",
+            help='Слова ищутся по всем спанам, фраза в кавычках — целиком, например "Unable to parse"'
+        )
+        if full_text_query:
+            search_index = load_search_index()
+            try:
+                results = search_index.search(full_text_query, SEARCH_LIMIT)
+            except sqlite3.OperationalError as e:
+                st.warning(f"Не удалось выполнить поиск: {e}")
+                results = []
+
+            if results:
+                st.write(f"Найдено {len(results)} спанов" + (" (показаны первые)" if len(results) == SEARCH_LIMIT else ""))
+                for i, (position, snippet) in enumerate(results):
+                    root_index = int(np.searchsorted(root_nodes, tree.root_of(position)))
+                    st.markdown(f"**{tree.names[position]}** ({tree.span_kinds[position]}), трейс №{root_index + 1}")
+                    st.caption(snippet)
+                    if st.button("➡️ Открыть", key=f"search_result_{i}_{tree.ids[position]}"):
+                        open_node(tree, position)
+                        st.rerun()
+            else:
+                st.warning("Ничего не найдено")
+
+        st.divider()
+
         if st.button("💾 Сохранить все"):
-            save_annotations(annotations)
+            save_annotations()
             st.success("Сохранено!")
 
         if st.button("📤 Экспорт"):
@@ -374,7 +429,7 @@ def main():
     with col1:
         if st.button("📦 Свернуть все", key="collapse_all_page"):
             # Сворачиваем все ноды на странице
-            for node_id in all_nodes:
+            for node_id in tree.ids:
                 node_collapsed_key = f"node_collapsed_{node_id}"
                 st.session_state[node_collapsed_key] = True
             st.rerun()
@@ -382,7 +437,7 @@ def main():
     with col2:
         if st.button("📂 Развернуть все", key="expand_all_page"):
             # Разворачиваем все ноды на странице
-            for node_id in all_nodes:
+            for node_id in tree.ids:
                 node_collapsed_key = f"node_collapsed_{node_id}"
                 st.session_state[node_collapsed_key] = False
             st.rerun()
@@ -399,10 +454,10 @@ def main():
     
     with col4:
         if st.button("💾 Сохранить", key="save_all"):
-            save_annotations(annotations)
+            save_annotations()
             st.success("Сохранено!")
 
-    display_root_node_with_children(current_root, all_nodes, annotations)
+    display_root_node_with_children(tree, store, current_root, annotations)
 
     st.subheader("⌨️ Быстрая навигация:")
     col1, col2, col3 = st.columns(3)
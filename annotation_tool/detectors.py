@@ -0,0 +1,197 @@
+import argparse
+import ast
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from annotation_store import AnnotationStore
+from span_store import SpanStore
+
+SPANS_PATH = 'data/processed/spans_df_20250716.arrow'
+
+
+@dataclass(frozen=True)
+class Rule:
+    """Правило поиска ошибочных спанов.
+
+    span_kinds, names и contains — векторные предфильтры по всей таблице,
+    check вызывается только для прошедших их строк и получает значения columns.
+    """
+
+    name: str
+    description: str
+    check: Callable[[dict], bool]
+    columns: tuple[str, ...]
+    span_kinds: tuple[str, ...] = ()
+    names: tuple[str, ...] = ()
+    contains: dict[str, str] = field(default_factory=dict)
+
+
+RULES: dict[str, Rule] = {}
+
+
+def rule(name, description, columns, span_kinds=(), names=(), contains=None):
+    # функции правил должны быть на уровне модуля, чтобы их можно было вызвать в процессах пула
+    def register(check):
+        RULES[name] = Rule(
+            name=name,
+            description=description,
+            check=check,
+            columns=tuple(columns),
+            span_kinds=tuple(span_kinds),
+            names=tuple(names),
+            contains=dict(contains or {}),
+        )
+        return check
+    return register
+
+
+@rule(
+    'empty_retrieval_documents',
+    'Ретривер не вернул документов',
+    columns=['attributes.retrieval.documents'],
+    span_kinds=['RETRIEVER'],
+)
+def empty_retrieval_documents(row):
+    documents = row['attributes.retrieval.documents']
+    return documents is None or documents.strip() == '[]'
+
+
+@rule(
+    'agent_creator_invalid_json',
+    'Ответ agent_creator не JSON с непустыми server и agent_role_prompt',
+    columns=['attributes.llm.output_messages'],
+    span_kinds=['LLM'],
+    contains={'attributes.llm.input_messages': 'You are a seasoned finance analyst AI assistant'},
+)
+def agent_creator_invalid_json(row):
+    output_messages = row['attributes.llm.output_messages']
+    if not isinstance(output_messages, str) or output_messages.strip() == '[]':
+        return True
+    try:
+        messages = ast.literal_eval(output_messages)
+        content = messages[-1]['message.content']
+        parsed = json.loads(content)
+    except Exception:
+        return True
+    if not isinstance(parsed, dict) or not {'server', 'agent_role_prompt'} <= parsed.keys():
+        return True
+    return not isinstance(parsed['server'], str) or len(parsed['server']) == 0
+
+
+def candidates(store, rule):
+    table = store.table
+    mask = np.ones(len(store), dtype=bool)
+    if rule.span_kinds:
+        mask &= pc.is_in(table.column('span_kind'), value_set=pa.array(rule.span_kinds, pa.string())) \
+            .fill_null(False).to_numpy(zero_copy_only=False)
+    if rule.names:
+        mask &= pc.is_in(table.column('name'), value_set=pa.array(rule.names, pa.string())) \
+            .fill_null(False).to_numpy(zero_copy_only=False)
+    for column, pattern in rule.contains.items():
+        if column not in store.columns:
+            return np.array([], dtype=np.int64)
+        # подстрока ищется только среди строк, оставшихся после фильтров по name и span_kind
+        positions = np.flatnonzero(mask)
+        matched = pc.match_substring(table.column(column).take(positions), pattern).fill_null(False)
+        mask[positions] = matched.to_numpy(zero_copy_only=False)
+    return np.flatnonzero(mask)
+
+
+_worker_store = None
+
+
+def _init_worker(spans_path):
+    # каждый процесс сам открывает memory map, между процессами передаются только номера строк
+    global _worker_store
+    _worker_store = SpanStore(spans_path)
+
+
+def _run_chunk(rule_name, positions):
+    rule = RULES[rule_name]
+    store = _worker_store
+    columns = [c for c in rule.columns if c in store.columns]
+    table = store.table.select(['context.span_id'] + columns).take(positions)
+    rows = table.to_pylist()
+    flagged = []
+    for row in rows:
+        for column in rule.columns:
+            row.setdefault(column, None)
+        if rule.check(row):
+            flagged.append(row['context.span_id'])
+    return rule_name, flagged
+
+
+def detect(spans_path=SPANS_PATH, rules=None, workers=None, chunk_size=2_000):
+    """Прогоняет правила по всем спанам и возвращает {span_id: [имена сработавших правил]}."""
+    store = SpanStore(spans_path)
+    rules = [RULES[name] for name in rules] if rules else list(RULES.values())
+
+    tasks = []
+    for r in rules:
+        positions = candidates(store, r)
+        for start in range(0, len(positions), chunk_size):
+            tasks.append((r.name, positions[start:start + chunk_size]))
+
+    if workers == 1 or len(tasks) <= 1:
+        _init_worker(spans_path)
+        results = [_run_chunk(*task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(spans_path,)) as executor:
+            results = list(executor.map(_run_chunk, *zip(*tasks)))
+
+    flagged = {}
+    for rule_name, span_ids in results:
+        for span_id in span_ids:
+            flagged.setdefault(span_id, []).append(rule_name)
+    return flagged
+
+
+def save_flagged(flagged, annotation_store):
+    # уже размеченные ноды не трогаем, остальные попадают в разметку как отклонённые
+    existing = annotation_store.load()
+    now = datetime.now().isoformat()
+    new = {
+        span_id: {
+            'comment': '; '.join(RULES[name].description for name in rule_names),
+            'approved': False,
+            'selected_attributes': [],
+            'detectors': rule_names,
+            'timestamp': now,
+        }
+        for span_id, rule_names in flagged.items()
+        if span_id not in existing
+    }
+    annotation_store.save_many(new)
+    annotation_store.compact()
+    return len(new)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Найти ошибочные спаны по правилам и добавить их в разметку")
+    parser.add_argument('--spans', default=SPANS_PATH)
+    parser.add_argument('--rules', nargs='*', choices=sorted(RULES), default=None)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--dry-run', action='store_true', help='только посчитать, не записывать в разметку')
+    args = parser.parse_args()
+
+    flagged = detect(args.spans, args.rules, args.workers)
+    counts = {}
+    for rule_names in flagged.values():
+        for name in rule_names:
+            counts[name] = counts.get(name, 0) + 1
+    for name, count in sorted(counts.items()):
+        print(f"{name}: {count}")
+    if not args.dry_run:
+        print(f"Добавлено в разметку: {save_flagged(flagged, AnnotationStore())}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+import os
+import re
+import sqlite3
+import threading
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE VIRTUAL TABLE IF NOT EXISTS spans USING fts5(
+    position UNINDEXED,
+    name,
+    content,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+"""
+
+
+def index_path_for(spans_path):
+    return Path(spans_path).with_suffix('.search.sqlite')
+
+
+def _source_version(path):
+    stat = os.stat(path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def make_match_query(text):
+    # слова ищутся как фразы (без синтаксиса FTS5), последнее — по префиксу;
+    # текст в кавычках ищется как одна фраза
+    phrases = re.findall(r'"([^"]+)"|(\S+)', text)
+    terms = []
+    for quoted, word in phrases:
+        term = (quoted or word).replace('"', '""')
+        terms.append(f'"{term}"')
+    if terms and not phrases[-1][0]:
+        terms[-1] += '*'
+    return ' '.join(terms)
+
+
+class SearchIndex:
+    """Полнотекстовый индекс SQLite FTS5 по названиям спанов и их атрибутам по умолчанию.
+
+    Индекс лежит рядом с файлом спанов и перестраивается, только если этот файл изменился.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    @property
+    def version(self):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        return row[0] if row else None
+
+    def build(self, store, tree, attributes_for, version, chunk_size=10_000):
+        # для каждого span_kind читаются только его текстовые атрибуты, кусками по chunk_size строк
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM spans")
+            for kind in pd.unique(tree.span_kinds):
+                positions = np.flatnonzero(tree.span_kinds == kind)
+                attrs = [a for a in attributes_for({'span_kind': kind}) if a != 'name' and a in store.columns]
+                for start in range(0, len(positions), chunk_size):
+                    chunk = positions[start:start + chunk_size]
+                    if attrs:
+                        frame = store.table.select(attrs).take(chunk).to_pandas()
+                        content = frame.fillna('').astype(str).agg('\n'.join, axis=1).to_numpy()
+                    else:
+                        content = [''] * len(chunk)
+                    self.conn.executemany(
+                        "INSERT INTO spans (position, name, content) VALUES (?, ?, ?)",
+                        zip(chunk.tolist(), tree.names[chunk].tolist(), content),
+                    )
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('version', ?)", (version,))
+            self.conn.execute("INSERT INTO spans (spans) VALUES ('optimize')")
+
+    def search(self, text, limit=100):
+        query = make_match_query(text)
+        if not query:
+            return []
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT position, snippet(spans, -1, '**', '**', '…', 16) FROM spans "
+                "WHERE spans MATCH ? ORDER BY rank LIMIT ?",
+                (query, limit),
+            ).fetchall()
+        return [(int(position), snippet) for position, snippet in rows]
+
+
+def open_search_index(spans_path, store, tree, attributes_for):
+    index = SearchIndex(index_path_for(spans_path))
+    version = _source_version(spans_path)
+    if index.version != version:
+        index.build(store, tree, attributes_for, version)
+    return index
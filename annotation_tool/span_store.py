@@ -0,0 +1,70 @@
+import sys
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+from span_tree import TREE_COLUMNS
+
+
+class SpanStore:
+    """Спаны в Arrow IPC файле без сжатия, открытом через memory map.
+
+    Таблица ссылается на страницы файла, а не копирует их в память: колонки дерева читаются сразу,
+    а тяжёлые атрибуты вроде attributes.llm.input_messages подгружаются только для развёрнутых нод.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._source = pa.memory_map(str(self.path))
+        self.table = pa.ipc.open_file(self._source).read_all()
+
+    def __len__(self):
+        return self.table.num_rows
+
+    @property
+    def columns(self):
+        return self.table.column_names
+
+    def tree_frame(self):
+        return self.table.select(TREE_COLUMNS).to_pandas()
+
+    def rows(self, positions, columns=None):
+        # slice не копирует данные, с диска читаются только страницы нужных строк
+        columns = [c for c in (columns or self.columns) if c in self.columns]
+        table = self.table.select(columns)
+        return pa.concat_tables([table.slice(int(p), 1) for p in positions]).to_pandas()
+
+    def row(self, position, columns=None):
+        return self.rows([position], columns).iloc[0]
+
+    def column(self, name):
+        return self.table.column(name)
+
+
+def convert_spans(source, target=None):
+    # CSV из ноутбука 04 или Parquet (файл или папка с партициями) -> Arrow IPC для SpanStore
+    source = Path(source)
+    target = Path(target) if target else source.with_suffix('.arrow')
+    if source.suffix == '.csv':
+        df = pd.read_csv(source)
+        df = df.drop(columns=[c for c in df.columns if c.startswith('Unnamed: ')])
+    else:
+        dataset = ds.dataset(source, format='parquet', partitioning='hive')
+        # части инкрементальной выгрузки могут отличаться набором колонок и типами (int64 и double)
+        schema = pa.unify_schemas(
+            [dataset.schema] + [f.physical_schema for f in dataset.get_fragments()], promote_options='permissive'
+        )
+        df = ds.dataset(source, schema=schema, format='parquet', partitioning='hive').to_table().to_pandas()
+    df = df.drop_duplicates('context.span_id', keep='last').reset_index(drop=True)
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    with pa.OSFile(str(target), 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table, max_chunksize=10_000)
+    return target
+
+
+if __name__ == '__main__':
+    print(convert_spans(*sys.argv[1:]))
@@ -0,0 +1,72 @@
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+TREE_COLUMNS = ['context.span_id', 'parent_id', 'name', 'span_kind']
+
+
+@dataclass
+class SpanTree:
+    """Индекс дерева спанов: массивы по позициям строк и дети в формате CSR."""
+
+    ids: np.ndarray
+    names: np.ndarray
+    span_kinds: np.ndarray
+    parents: np.ndarray
+    child_offsets: np.ndarray
+    child_positions: np.ndarray
+    roots: np.ndarray
+    positions: pd.Index
+
+    def __len__(self):
+        return len(self.ids)
+
+    def children(self, position: int) -> np.ndarray:
+        return self.child_positions[self.child_offsets[position]:self.child_offsets[position + 1]]
+
+    def node(self, position: int) -> dict:
+        return {
+            'id': self.ids[position],
+            'name': self.names[position],
+            'span_kind': self.span_kinds[position],
+            'position': position,
+        }
+
+    def position_of(self, span_id: str) -> int:
+        return self.positions.get_loc(span_id)
+
+    def root_of(self, position: int) -> int:
+        while self.parents[position] != -1:
+            position = int(self.parents[position])
+        return position
+
+    def path_to(self, position: int) -> list[int]:
+        path = [position]
+        while self.parents[path[-1]] != -1:
+            path.append(int(self.parents[path[-1]]))
+        return path[::-1]
+
+
+def build_span_tree(df: pd.DataFrame) -> SpanTree:
+    ids = df['context.span_id'].to_numpy()
+    positions = pd.Index(ids)
+    # позиция родителя для каждой строки, -1 для корней и спанов с родителем вне выгрузки
+    parents = positions.get_indexer(df['parent_id'])
+
+    has_parent = np.flatnonzero(parents != -1)
+    # стабильная сортировка сохраняет порядок детей как в файле
+    child_positions = has_parent[np.argsort(parents[has_parent], kind='stable')]
+    counts = np.bincount(parents[has_parent], minlength=len(ids))
+    child_offsets = np.concatenate([[0], np.cumsum(counts)])
+
+    return SpanTree(
+        ids=ids,
+        names=df['name'].astype(str).to_numpy(),
+        span_kinds=df['span_kind'].astype(str).to_numpy(),
+        parents=parents,
+        child_offsets=child_offsets,
+        child_positions=child_positions,
+        roots=np.flatnonzero(parents == -1),
+        positions=positions,
+    )
@@ -0,0 +1,55 @@
+"""Startup benchmark: how long `import fact_eval.pipeline` takes in a fresh interpreter.
+
+python benchmarks/import_time.py --repeat 10
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def measure(module: str) -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", f"import {module}"], cwd=ROOT, check=True)
+    return time.perf_counter() - start
+
+
+def slowest_imports(module: str, top: int) -> list[tuple[int, str]]:
+    # -X importtime prints "import time: self [us] | cumulative | imported package" to stderr
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, check=True, capture_output=True, text=True
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative), name.rstrip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", default="fact_eval.pipeline")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    baseline = [measure("sys") for _ in range(args.repeat)]
+    timings = [measure(args.module) for _ in range(args.repeat)]
+    interpreter = statistics.median(baseline)
+    print(f"import {args.module}: median {statistics.median(timings) - interpreter:.3f}s "
+          f"(min {min(timings) - interpreter:.3f}s, interpreter startup {interpreter:.3f}s excluded)")
+
+    print("slowest imports (cumulative):")
+    for cumulative, name in slowest_imports(args.module, args.top):
+        print(f"{cumulative / 1e6:8.3f}s {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from bertopic.backend import BaseEmbedder
+
+EMBEDDINGS_PATH = Path("./data/interim/embeddings")
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Embeddings on disk, one directory per model.
+
+    vectors.f32 is an append-only float32 matrix that is read through np.memmap,
+    index.txt holds the text hash of each row in the same order.
+    """
+
+    def __init__(self, model: str, directory: Path = EMBEDDINGS_PATH):
+        self.model = model
+        self.directory = Path(directory) / re.sub(r"[^\w.-]", "_", model)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.vectors_path = self.directory / "vectors.f32"
+        self.index_path = self.directory / "index.txt"
+        self.meta_path = self.directory / "meta.json"
+        self._lock = threading.Lock()
+        self._matrix = None
+
+        self.dim = None
+        if self.meta_path.exists():
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                self.dim = json.load(f)["dim"]
+        hashes = []
+        if self.index_path.exists():
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                hashes = [line.strip() for line in f if line.strip()]
+        vector_rows = self.vectors_path.stat().st_size // (4 * self.dim) if self.dim and self.vectors_path.exists() else 0
+        # a crash between writing vectors and the index leaves them with different lengths, both are cut back
+        rows = min(len(hashes), vector_rows)
+        if rows < len(hashes):
+            with open(self.index_path, "w", encoding="utf-8") as f:
+                f.writelines(h + "\n" for h in hashes[:rows])
+        if self.vectors_path.exists() and self.dim and self.vectors_path.stat().st_size != rows * 4 * self.dim:
+            os.truncate(self.vectors_path, rows * 4 * self.dim)
+        self.rows = {h: i for i, h in enumerate(hashes[:rows])}
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, key: str):
+        return key in self.rows
+
+    @property
+    def matrix(self) -> np.ndarray:
+        if self._matrix is None or len(self._matrix) < len(self.rows):
+            self._matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(len(self.rows), self.dim))
+        return self._matrix
+
+    def get(self, keys: list[str]) -> np.ndarray:
+        with self._lock:
+            return np.asarray(self.matrix[[self.rows[key] for key in keys]])
+
+    def add(self, keys: list[str], vectors) -> None:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            new = list({key: i for i, key in enumerate(keys) if key not in self.rows}.values())
+            if not new:
+                return
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                with open(self.meta_path, "w", encoding="utf-8") as f:
+                    json.dump({"model": self.model, "dim": self.dim}, f)
+            with open(self.vectors_path, "ab") as f:
+                f.write(vectors[new].tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self.index_path, "a", encoding="utf-8") as f:
+                f.writelines(keys[i] + "\n" for i in new)
+            for i in new:
+                self.rows[keys[i]] = len(self.rows)
+
+
+class CustomEmbedder(BaseEmbedder):
+    """BERTopic backend over a langchain embedding model with an on-disk cache.
+
+    Only texts missing from the cache are sent, in batches of at most batch_size texts and
+    max_batch_chars characters, with up to concurrency batches in flight.
+    """
+
+    def __init__(
+        self,
+        embedding_model,
+        cache: EmbeddingCache | None = None,
+        batch_size: int = 32,
+        max_batch_chars: int = 50_000,
+        concurrency: int = 4,
+    ):
+        super().__init__()
+        self.embedding_model = embedding_model
+        if cache is None:
+            cache = EmbeddingCache(getattr(embedding_model, "model", None) or type(embedding_model).__name__)
+        self.cache = cache
+        self.batch_size = batch_size
+        self.max_batch_chars = max_batch_chars
+        self.concurrency = concurrency
+
+    def batches(self, texts: list[str]) -> list[list[str]]:
+        batches, batch, chars = [], [], 0
+        for text in texts:
+            if batch and (len(batch) >= self.batch_size or chars + len(text) > self.max_batch_chars):
+                batches.append(batch)
+                batch, chars = [], 0
+            batch.append(text)
+            chars += len(text)
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def _embed_batch(self, batch: list[str]) -> None:
+        # each batch is cached as soon as it arrives, an interrupted run keeps what it already paid for
+        self.cache.add([text_hash(text) for text in batch], self.embedding_model.embed_documents(batch))
+
+    def embed(self, documents, verbose=False) -> np.ndarray:
+        keys = [text_hash(text) for text in documents]
+        missing = list({key: text for key, text in zip(keys, documents) if key not in self.cache}.values())
+        if missing:
+            batches = self.batches(missing)
+            if verbose:
+                print(f"Embedding {len(missing)} new texts in {len(batches)} batches, {len(documents) - len(missing)} cached")
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                list(executor.map(self._embed_batch, batches))
+        return self.cache.get(keys)
@@ -0,0 +1,140 @@
+import json
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+from sklearn.neighbors import NearestNeighbors
+
+TOPICS_PATH = Path("./data/interim/topics")
+OUTLIER = -1
+
+
+def normalize(embeddings) -> np.ndarray:
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    return embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+
+
+class IncrementalTopics:
+    """Assigns new notes to the topics of a fitted BERTopic model without refitting it.
+
+    A new note gets the majority topic of its n_neighbors nearest clustered notes. As in HDBSCAN, a note's
+    core distance is the distance to its n_neighbors-th nearest clustered note; the new note stays in the topic
+    only if its core distance is within those of the topic's own notes (by default the largest of them,
+    radius_quantile tightens it), otherwise it is an outlier (-1).
+    The model is refitted on all notes once the share of outliers among notes added since
+    the last fit exceeds refit_threshold.
+
+    make_model builds a fresh BERTopic, e.g. with the UMAP and HDBSCAN settings from annotation.py.
+    """
+
+    def __init__(
+        self,
+        make_model: Callable,
+        embedder,
+        n_neighbors: int = 5,
+        radius_quantile: float = 0.0,
+        refit_threshold: float = 0.3,
+        min_refit_notes: int = 20,
+    ):
+        self.make_model = make_model
+        self.embedder = embedder
+        self.n_neighbors = n_neighbors
+        self.radius_quantile = radius_quantile
+        self.refit_threshold = refit_threshold
+        self.min_refit_notes = min_refit_notes
+
+        self.topic_model = None
+        self.docs: list[str] = []
+        self.embeddings = np.empty((0, 0), dtype=np.float32)
+        self.topics = np.empty(0, dtype=np.int64)
+        self.fitted_count = 0
+
+    def fit(self, docs: list[str], embeddings=None):
+        embeddings = self.embedder.embed(docs) if embeddings is None else embeddings
+        self.topic_model = self.make_model()
+        topics, _ = self.topic_model.fit_transform(docs, np.asarray(embeddings))
+        self.docs = list(docs)
+        self.embeddings = normalize(embeddings)
+        self.topics = np.asarray(topics, dtype=np.int64)
+        self.fitted_count = len(self.docs)
+        self._build_index()
+        return self.topics
+
+    def _build_index(self):
+        # on unit vectors the euclidean order equals the cosine one, so tree indexes can be used
+        self.note_positions = np.flatnonzero(self.topics != OUTLIER)
+        self.note_index = NearestNeighbors(n_neighbors=min(self.n_neighbors, max(len(self.note_positions), 1)))
+        self.radii = {}
+        if not len(self.note_positions):
+            return
+        self.note_index.fit(self.embeddings[self.note_positions])
+        # each note is its own nearest neighbour, so one more is requested to skip it
+        distances, _ = self.note_index.kneighbors(
+            self.embeddings[self.note_positions],
+            n_neighbors=min(self.note_index.n_neighbors + 1, len(self.note_positions)),
+        )
+        core_distances = distances[:, -1]
+        note_topics = self.topics[self.note_positions]
+        for topic in np.unique(note_topics):
+            self.radii[topic] = float(np.quantile(core_distances[note_topics == topic], 1 - self.radius_quantile))
+
+    @property
+    def outlier_share(self) -> float:
+        new_topics = self.topics[self.fitted_count:]
+        return float(np.mean(new_topics == OUTLIER)) if len(new_topics) else 0.0
+
+    def assign(self, embeddings) -> np.ndarray:
+        embeddings = normalize(embeddings)
+        if not len(self.note_positions):
+            return np.full(len(embeddings), OUTLIER, dtype=np.int64)
+        distances, neighbours = self.note_index.kneighbors(embeddings)
+        neighbour_topics = self.topics[self.note_positions[neighbours]]
+
+        topics = np.empty(len(embeddings), dtype=np.int64)
+        for i, votes in enumerate(neighbour_topics):
+            values, counts = np.unique(votes, return_counts=True)
+            topic = values[np.argmax(counts)]
+            topics[i] = topic if distances[i, -1] <= self.radii[topic] else OUTLIER
+        return topics
+
+    def update(self, docs: list[str], embeddings=None) -> np.ndarray:
+        """Adds new notes and returns their topics; refits when too many of them are outliers."""
+        if not docs:
+            return np.empty(0, dtype=np.int64)
+        embeddings = self.embedder.embed(docs) if embeddings is None else embeddings
+        topics = self.assign(embeddings)
+        self.docs.extend(docs)
+        self.embeddings = np.vstack([self.embeddings, normalize(embeddings)])
+        self.topics = np.concatenate([self.topics, topics])
+
+        new_count = len(self.docs) - self.fitted_count
+        if new_count >= self.min_refit_notes and self.outlier_share > self.refit_threshold:
+            print(f"{self.outlier_share:.0%} of {new_count} new notes are outliers, refitting")
+            return self.fit(self.docs, self.embeddings)[-len(docs):]
+        return topics
+
+    def save(self, path: Path = TOPICS_PATH):
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        # the embedder holds an api client and a cache, it is passed again on load
+        self.topic_model.save(path / "bertopic", serialization="pickle", save_embedding_model=False)
+        np.save(path / "embeddings.npy", self.embeddings)
+        with open(path / "notes.json", "w", encoding="utf-8") as f:
+            json.dump(
+                {"docs": self.docs, "topics": self.topics.tolist(), "fitted_count": self.fitted_count},
+                f, ensure_ascii=False,
+            )
+
+    def load(self, path: Path = TOPICS_PATH):
+        from bertopic import BERTopic
+
+        path = Path(path)
+        self.topic_model = BERTopic.load(path / "bertopic", embedding_model=self.embedder)
+        self.embeddings = np.load(path / "embeddings.npy", mmap_mode="r")
+        with open(path / "notes.json", "r", encoding="utf-8") as f:
+            notes = json.load(f)
+        self.docs = notes["docs"]
+        self.topics = np.asarray(notes["topics"], dtype=np.int64)
+        self.fitted_count = notes["fitted_count"]
+        self._build_index()
+        return self
@@ -1,6 +1,5 @@
-from langchain_core.output_parsers.json import JsonOutputParser
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_gigachat.chat_models import GigaChat
+from fact_eval.llm import ModelRouter, default_router, make_prompt
+from fact_eval.parsing import parse_json_list
 
 deduplicate_prompt_template_en = """You will be given a list of statements. You need to de-duplicate them and return a list of indices of the unique statements. Note: Two statements are considered duplicates only if they express *exactly the same thing*. If there are no duplicate statements in the list, return the complete list of indices.
 
@@ -13,7 +12,12 @@ Below is the list of statements you need to de-duplicate:
 Please begin the extraction now. Output only the integer list, without any conversational text or explanations."""
 
 
-def deduplicate(extracted_dict: dict) -> dict:
+def is_valid_dedup(deduped_idx, group: list) -> bool:
+    return bool(deduped_idx) and 0 not in deduped_idx and len(deduped_idx) <= len(group)
+
+
+def deduplicate(extracted_dict: dict, router: ModelRouter | None = None) -> dict:
+    router = router or default_router
     citations = extracted_dict['citations']
     citation_groups: dict[str, list[str | dict]] = {}
     for _c in citations:
@@ -26,15 +30,7 @@ def deduplicate(extracted_dict: dict) -> dict:
 
     citations_groups_deduped: dict[str, dict[str, list[str | None] | None]] = {}
 
-    deduplicate_prompt = ChatPromptTemplate([
-        ("human", deduplicate_prompt_template_en),
-    ])
-    llm = GigaChat(
-            model="GigaChat-2-Max",
-            verify_ssl_certs=False,
-            profanity_check=False
-        )
-    deduplicate_chain = deduplicate_prompt | llm | JsonOutputParser()
+    deduplicate_prompt = make_prompt(deduplicate_prompt_template_en)
 
     for ref_idx, group in citation_groups.items():
         if len(group) == 1:
@@ -47,19 +43,29 @@ def deduplicate(extracted_dict: dict) -> dict:
         statements = '\n'.join([f'{i+1}. {_c["fact"]}' for i, _c in enumerate(group)])
 
         retries = 0
+        escalated = False
 
         deduped_idx = []
         while retries < 3:
             retries += 1
             try:
-                deduped_idx = deduplicate_chain.invoke({"statements": statements})
-                break
+                deduped_idx, complete = parse_json_list(
+                    router.invoke('deduplicate', deduplicate_prompt, {"statements": statements}, escalated)
+                )
+                if not complete:
+                    raise ValueError(f"malformed index list, salvaged {deduped_idx}")
             except Exception as e:
                 print(repr(e))
+                escalated = True
+                continue
+            # an index list that does not fit the group is retried once with the bigger model
+            if not is_valid_dedup(deduped_idx, group) and router.can_escalate('deduplicate') and not escalated:
+                escalated = True
                 continue
+            break
 
         # if the model failed to deduplicate, use the default deduplication
-        if not deduped_idx or 0 in deduped_idx or len(deduped_idx) > len(group):
+        if not is_valid_dedup(deduped_idx, group):
             deduped_idx = [i+1 for i in range(len(group))]
 
         # deduplicate the citations by url
@@ -0,0 +1,150 @@
+import math
+import random
+from collections import Counter
+from statistics import NormalDist, variance
+from urllib.parse import urlparse
+
+from fact_eval.llm import ModelRouter
+from fact_eval.validate import validate_
+
+
+def wilson_interval(successes: float, total: float, confidence: float = 0.95) -> tuple[float, float]:
+    if total == 0:
+        return 0.0, 1.0
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    p = successes / total
+    denominator = 1 + z ** 2 / total
+    center = (p + z ** 2 / (2 * total)) / denominator
+    margin = z * math.sqrt(p * (1 - p) / total + z ** 2 / (4 * total ** 2)) / denominator
+    return max(0.0, center - margin), min(1.0, center + margin)
+
+
+def citation_domain(citation) -> str:
+    return urlparse(citation[0]).netloc
+
+
+def group_interval(
+    samples: dict[str, list[tuple[int, int]]], sizes: dict[str, int], confidence: float = 0.95
+) -> tuple[float | None, tuple[float, float]]:
+    """Ratio estimate of the supported fraction from validated url groups and its interval.
+
+    samples maps each stratum to (supported, counted) facts of its validated groups, sizes to its number
+    of groups. Facts of one page are correlated, so url groups are the sampling units: strata are weighted
+    by their number of groups and the variance comes from the spread between groups. It is turned into an
+    effective number of facts for a Wilson interval, which is then narrowed for the share of groups
+    already validated (validating every group gives the exact rate).
+    """
+    if any(not samples.get(stratum) for stratum in sizes):
+        return None, (0.0, 1.0)
+    supported = sum(size * sum(y for y, _ in samples[h]) / len(samples[h]) for h, size in sizes.items())
+    counted = sum(size * sum(m for _, m in samples[h]) / len(samples[h]) for h, size in sizes.items())
+    if counted == 0:
+        return None, (0.0, 1.0)
+    ratio = supported / counted
+
+    groups = [group for h in sizes for group in samples[h]]
+    facts = sum(m for _, m in groups)
+    residuals = {h: [y - ratio * m for y, m in samples[h]] for h in sizes}
+    # a stratum with a single validated group borrows the residual variance of all groups
+    pooled = variance([e for h in sizes for e in residuals[h]]) if len(groups) > 1 else None
+    ratio_variance = 0.0
+    for h, size in sizes.items():
+        spread = variance(residuals[h]) if len(residuals[h]) > 1 else pooled
+        if spread is None:
+            ratio_variance = None
+            break
+        ratio_variance += size ** 2 * spread / len(residuals[h])
+    binomial_variance = ratio * (1 - ratio) / facts
+    if ratio_variance is None or binomial_variance == 0:
+        # the clustering can't be measured yet (or every fact agrees): count each group as one trial
+        effective = len(groups)
+    else:
+        effective = facts * binomial_variance / (ratio_variance / counted ** 2) if ratio_variance else facts
+    effective = min(max(effective, len(groups)), facts)
+
+    low, high = wilson_interval(ratio * effective, effective, confidence)
+    finite = math.sqrt(1 - len(groups) / sum(sizes.values()))
+    return ratio, (max(0.0, ratio - (ratio - low) * finite), min(1.0, ratio + (high - ratio) * finite))
+
+
+def order_citations(citations: list, order: str = 'random', seed: int | None = None) -> list:
+    rng = random.Random(seed)
+    citations = list(citations)
+    if order == 'random':
+        rng.shuffle(citations)
+        return citations
+    if order != 'stratified':
+        raise ValueError(f"unknown order: {order!r}, expected 'random' or 'stratified'")
+
+    # stratify by domain: shuffle inside each domain, then take one group per domain in turn,
+    # so that the first validated groups cover as many different sources as possible;
+    # validate_sequential weights the domains back by their number of groups
+    strata: dict[str, list] = {}
+    for citation in citations:
+        strata.setdefault(citation_domain(citation), []).append(citation)
+    domains = list(strata)
+    rng.shuffle(domains)
+    for domain in domains:
+        rng.shuffle(strata[domain])
+
+    ordered = []
+    while len(ordered) < len(citations):
+        for domain in domains:
+            if strata[domain]:
+                ordered.append(strata[domain].pop())
+    return ordered
+
+
+def validate_sequential(
+    scraped_dict: dict,
+    ci_width: float = 10.0,
+    confidence: float = 0.95,
+    order: str = 'random',
+    min_groups: int = 3,
+    seed: int | None = None,
+    router: ModelRouter | None = None,
+) -> dict:
+    # validate url groups one by one until the confidence interval on the supported
+    # fraction is narrower than ci_width (in percentage points, like valid_rate)
+    citations = order_citations(list(scraped_dict['citations_deduped'].items()), order, seed)
+    stratum = citation_domain if order == 'stratified' else (lambda citation: '')
+    sizes = Counter(stratum(citation) for citation in citations)
+
+    groups = {}
+    samples: dict[str, list[tuple[int, int]]] = {}
+    validated_groups = 0
+    ratio, interval = None, (0.0, 100.0)
+
+    for citation in citations:
+        res = validate_(citation, router)
+        validated_groups += 1
+        groups[res['url']] = {'validate_res': res['validate_res'], 'validate_error': res['error']}
+
+        supported = counted = 0
+        if res['error'] is None:
+            for _c in res['validate_res']:
+                if _c['result'] != 'unknown':
+                    counted += 1
+                    if _c['result'] == 'supported':
+                        supported += 1
+        samples.setdefault(stratum(citation), []).append((supported, counted))
+
+        ratio, (low, high) = group_interval(samples, sizes, confidence)
+        interval = (low * 100, high * 100)
+        if validated_groups >= min_groups and ratio is not None and interval[1] - interval[0] < ci_width:
+            break
+
+    # groups without a reference are answered without calling the model
+    remaining = citations[validated_groups:]
+    llm_calls_saved = len([c for c in remaining if c[1]['url_content'] is not None])
+
+    return {
+        'valid_rate': ratio * 100 if ratio is not None else None,
+        'interval': interval,
+        'confidence': confidence,
+        'validated_groups': validated_groups,
+        'total_groups': len(citations),
+        'llm_calls_saved': llm_calls_saved,
+        # results of the validated groups by url, the input dict is left as it is
+        'groups': groups,
+    }
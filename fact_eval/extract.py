@@ -1,8 +1,8 @@
 import re
+from collections.abc import AsyncIterator
 
-from langchain_core.output_parsers.json import JsonOutputParser
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_gigachat.chat_models import GigaChat
+from fact_eval.llm import ModelRouter, default_router, make_prompt
+from fact_eval.parsing import JsonListStream, parse_json_list
 
 extract_prompt_template_en = """You will be provided with a research report. The body of the report will contain some citations to references.
 
@@ -56,43 +56,96 @@ def remove_urls(input_text):
     return pattern.sub(r'[\1]', input_text)
 
 
-def clean_escape(input_text):
-    # replace illegal escape characters
-    input_text = input_text.replace("\\>", ">")
-    input_text = input_text.replace("\\<", "<")
-    input_text = input_text.replace("\\+", "+")
-    input_text = input_text.replace("\\~", "~")
-    return input_text
-
+def remaining_report(report_text: str, citations: list) -> str:
+    # cut the report after the last extracted fact, so that a retry after a truncated answer
+    # only asks for the citations that are still missing. The reference list stays at the end
+    if not citations:
+        return report_text
+    fact = citations[-1]['fact']
+    pos = report_text.find(fact)
+    if pos != -1:
+        return report_text[pos + len(fact):]
+    pos = report_text.find(fact[:40])
+    if pos != -1:
+        return report_text[pos:]
+    return report_text
+
+
+def collect_citations(items: list, citations: list, seen: set) -> list:
+    # keep well-formed triplets not seen before, a retry may repeat some of them
+    new_citations = []
+    for c in items:
+        if not isinstance(c, dict) or 'fact' not in c:
+            continue
+        key = (c['fact'], c.get('url'))
+        if key not in seen:
+            seen.add(key)
+            citations.append(c)
+            new_citations.append(c)
+    return new_citations
+
+
+def extract(report_text: str, router: ModelRouter | None = None) -> dict:
+    router = router or default_router
+    prompt = make_prompt(extract_prompt_template_en)
+
+    citations = []
+    seen = set()
+    parsed = False
+    remaining_text = report_text
+    escalated = False
+    retries = 0
+    while retries < 3:
+        retries += 1
+        try:
+            output = router.invoke('extract', prompt, {"report_text": remaining_text}, escalated)
+        except Exception as e:
+            print(repr(e))
+            escalated = True
+            continue
 
-def extract(report_text: str) -> dict:
-    prompt = ChatPromptTemplate([
-        ("human", extract_prompt_template_en),
-    ])
+        items, complete = parse_json_list(output)
+        parsed = parsed or complete or bool(items)
+        collect_citations(items, citations, seen)
+        if complete:
+            break
+        print(f"extraction output is malformed or truncated, salvaged {len(citations)} citations")
+        escalated = True
+        remaining_text = remaining_report(report_text, citations)
 
-    llm = GigaChat(
-        model="GigaChat-2-Max",
-        verify_ssl_certs=False,
-        profanity_check=False
-    )
+    extracted_dict = dict()
+    if parsed:
+        extracted_dict['citations'] = citations
+        for c in extracted_dict['citations']:
+            c['fact'] = remove_urls(c['fact'])
+    else:
+        extracted_dict['citations'] = "extraction failed"
+    return extracted_dict
 
-    chain = prompt | llm | JsonOutputParser()
 
-    extracted = chain.invoke({"report_text": report_text})
+async def extract_stream(report_text: str, router: ModelRouter | None = None) -> AsyncIterator[dict]:
+    # same as extract, but consumes the model's token stream and yields every
+    # {fact, ref_idx, url} triplet as soon as its object is closed
+    router = router or default_router
+    prompt = make_prompt(extract_prompt_template_en)
 
-    extracted_dict = dict()
+    citations = []
+    seen = set()
+    remaining_text = report_text
+    escalated = False
     retries = 0
     while retries < 3:
         retries += 1
+        stream = JsonListStream()
         try:
-            if extracted != "":
-                extracted_dict['citations'] = extracted
-                for c in extracted_dict['citations']:
-                    c['fact'] = remove_urls(c['fact'])
-            else:
-                extracted_dict['citations'] = "extraction failed"
-            break
+            async for chunk in router.astream('extract', prompt, {"report_text": remaining_text}, escalated):
+                for c in collect_citations(stream.feed(chunk), citations, seen):
+                    yield {**c, 'fact': remove_urls(c['fact'])}
         except Exception as e:
             print(repr(e))
-            continue
-    return extracted_dict
+        else:
+            if stream.complete:
+                return
+            print(f"extraction output is malformed or truncated, salvaged {len(citations)} citations")
+        escalated = True
+        remaining_text = remaining_report(report_text, citations)
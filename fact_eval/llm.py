@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import asyncio
+import functools
+import threading
+import time
+from collections.abc import AsyncIterator
+from dataclasses import asdict, dataclass
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from langchain_core.prompts import ChatPromptTemplate
+    from langchain_gigachat.chat_models import GigaChat
+
+DEFAULT_MODEL = "GigaChat-2-Max"
+
+
+@functools.cache
+def make_prompt(template: str) -> ChatPromptTemplate:
+    # langchain is imported on first use, so that importing fact_eval stays cheap
+    from langchain_core.prompts import ChatPromptTemplate
+
+    return ChatPromptTemplate([
+        ("human", template),
+    ])
+
+
+@dataclass
+class StageRoute:
+    model: str = DEFAULT_MODEL
+    # bigger model to retry with on parse failure or an inconsistent answer
+    escalate_to: str | None = None
+
+
+@dataclass
+class ModelUsage:
+    calls: int = 0
+    errors: int = 0
+    latency: float = 0.0
+    input_tokens: int = 0
+    output_tokens: int = 0
+
+
+class ModelRouter:
+    """Picks a GigaChat model per stage and accounts latency and token usage per model.
+
+    Share one router across a batch run and read `usage_report()` at the end, e.g.
+    ModelRouter({'deduplicate': 'GigaChat-2', 'validate': StageRoute('GigaChat-2-Pro', 'GigaChat-2-Max')})
+    """
+
+    def __init__(self, routes: dict[str, str | StageRoute] | None = None, default: StageRoute | None = None):
+        self.routes = {
+            stage: StageRoute(route) if isinstance(route, str) else route
+            for stage, route in (routes or {}).items()
+        }
+        self.default = default or StageRoute()
+        self.usage: dict[str, ModelUsage] = {}
+        self._llms: dict[str, GigaChat] = {}
+        self._lock = threading.Lock()
+
+    def route(self, stage: str) -> StageRoute:
+        return self.routes.get(stage, self.default)
+
+    def can_escalate(self, stage: str) -> bool:
+        return self.route(stage).escalate_to is not None
+
+    def model_for(self, stage: str, escalated: bool = False) -> str:
+        route = self.route(stage)
+        if escalated and route.escalate_to is not None:
+            return route.escalate_to
+        return route.model
+
+    def llm(self, model: str) -> GigaChat:
+        with self._lock:
+            if model not in self._llms:
+                from langchain_gigachat.chat_models import GigaChat
+
+                self._llms[model] = GigaChat(
+                    model=model,
+                    verify_ssl_certs=False,
+                    profanity_check=False
+                )
+            return self._llms[model]
+
+    def invoke(self, stage: str, prompt: ChatPromptTemplate, inputs: dict, escalated: bool = False) -> str:
+        model = self.model_for(stage, escalated)
+        chain = prompt | self.llm(model)
+
+        start = time.perf_counter()
+        message = None
+        try:
+            message = chain.invoke(inputs)
+        finally:
+            self._record(model, time.perf_counter() - start, message, failed=message is None)
+        return message.content
+
+    async def ainvoke(self, stage: str, prompt: ChatPromptTemplate, inputs: dict, escalated: bool = False) -> str:
+        model = self.model_for(stage, escalated)
+        chain = prompt | self.llm(model)
+
+        start = time.perf_counter()
+        message = None
+        try:
+            message = await chain.ainvoke(inputs)
+        finally:
+            self._record(model, time.perf_counter() - start, message, failed=message is None)
+        return message.content
+
+    async def ainvoke_structured(
+        self, stage: str, prompt: ChatPromptTemplate, inputs: dict, schema, escalated: bool = False
+    ):
+        # include_raw keeps the model message next to the parsed object, so that its token usage is recorded
+        model = self.model_for(stage, escalated)
+        chain = prompt | self.llm(model).with_structured_output(schema, include_raw=True)
+
+        start = time.perf_counter()
+        result = None
+        try:
+            result = await chain.ainvoke(inputs)
+        finally:
+            failed = result is None or result['parsing_error'] is not None or result['parsed'] is None
+            self._record(model, time.perf_counter() - start, result and result['raw'], failed=failed)
+        if result['parsing_error'] is not None:
+            raise result['parsing_error']
+        if result['parsed'] is None:
+            raise ValueError(f"{model} returned no {getattr(schema, '__name__', schema)}")
+        return result['parsed']
+
+    async def astream(
+        self, stage: str, prompt: ChatPromptTemplate, inputs: dict, escalated: bool = False
+    ) -> AsyncIterator[str]:
+        model = self.model_for(stage, escalated)
+        chain = prompt | self.llm(model)
+
+        start = time.perf_counter()
+        message = None
+        failed = True
+        try:
+            async for chunk in chain.astream(inputs):
+                message = chunk if message is None else message + chunk
+                yield chunk.content
+            failed = False
+        finally:
+            self._record(model, time.perf_counter() - start, message, failed)
+
+    def _record(self, model: str, latency: float, message, failed: bool) -> None:
+        with self._lock:
+            usage = self.usage.setdefault(model, ModelUsage())
+            usage.calls += 1
+            usage.latency += latency
+            if failed:
+                usage.errors += 1
+            if message is None:
+                return
+            usage_metadata = getattr(message, 'usage_metadata', None) or {}
+            usage.input_tokens += usage_metadata.get('input_tokens', 0)
+            usage.output_tokens += usage_metadata.get('output_tokens', 0)
+
+    def usage_report(self) -> dict[str, dict]:
+        with self._lock:
+            report = {}
+            for model, usage in self.usage.items():
+                report[model] = asdict(usage)
+                report[model]['avg_latency'] = usage.latency / usage.calls if usage.calls else 0.0
+            return report
+
+
+class RateLimiter:
+    """Spaces out calls from all coroutines to at most `rate` per second."""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate > 0 else 0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+default_router = ModelRouter()
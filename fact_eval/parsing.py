@@ -0,0 +1,136 @@
+import json
+
+_STRUCTURAL = ',:}]'
+
+
+def clean_escape(input_text):
+    # replace illegal escape characters
+    input_text = input_text.replace("\\>", ">")
+    input_text = input_text.replace("\\<", "<")
+    input_text = input_text.replace("\\+", "+")
+    input_text = input_text.replace("\\~", "~")
+    return input_text
+
+
+def strip_code_fence(text: str) -> str:
+    text = text.strip()
+    if text.startswith('```'):
+        text = text.split('\n', 1)[1] if '\n' in text else ''
+        if text.rstrip().endswith('```'):
+            text = text.rstrip()[:-3]
+    return text
+
+
+def _is_closing_quote(text: str, pos: int) -> bool:
+    # a quote closes a string only if it is followed by a structural character,
+    # otherwise it is an unescaped quote inside the string
+    pos += 1
+    while pos < len(text) and text[pos] in ' \t\r\n':
+        pos += 1
+    return pos >= len(text) or text[pos] in _STRUCTURAL
+
+
+def _scan_value(text: str, start: int) -> tuple[str | None, int]:
+    # copy one array item starting at `start`, escaping stray quotes and dropping trailing commas.
+    # returns (repaired item text, position after it), or (None, len(text)) if the item is truncated
+    out = []
+    depth = 0
+    in_string = False
+    pos = start
+    while pos < len(text):
+        ch = text[pos]
+        if in_string:
+            if ch == '\\' and pos + 1 < len(text):
+                out.append(text[pos:pos + 2])
+                pos += 2
+                continue
+            if ch == '"':
+                if _is_closing_quote(text, pos):
+                    in_string = False
+                else:
+                    out.append('\\')
+            out.append(ch)
+        elif ch == '"':
+            in_string = True
+            out.append(ch)
+        elif ch in '{[':
+            depth += 1
+            out.append(ch)
+        elif ch in '}]':
+            if depth == 0:
+                return ''.join(out).strip(), pos
+            # drop a trailing comma before the closing bracket
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ',':
+                out.pop()
+            depth -= 1
+            out.append(ch)
+            if depth == 0:
+                return ''.join(out).strip(), pos + 1
+        elif ch == ',' and depth == 0:
+            return ''.join(out).strip(), pos
+        else:
+            out.append(ch)
+        pos += 1
+    return None, pos
+
+
+class JsonListStream:
+    """Parses a JSON list as it is streamed, returning every item as soon as it is closed."""
+
+    def __init__(self):
+        self.buffer = ''
+        self.pos: int | None = None
+        self.closed = False
+        self.dropped = 0
+
+    @property
+    def complete(self) -> bool:
+        return self.closed and not self.dropped
+
+    def feed(self, chunk: str) -> list:
+        self.buffer += chunk
+        items = []
+        if self.pos is None:
+            start = self.buffer.find('[')
+            if start == -1:
+                return items
+            self.pos = start + 1
+
+        while not self.closed and self.pos < len(self.buffer):
+            ch = self.buffer[self.pos]
+            if ch.isspace() or ch == ',':
+                self.pos += 1
+                continue
+            if ch == ']':
+                self.closed = True
+                break
+            # an item that is not closed yet is scanned again once more text arrives
+            item_text, end = _scan_value(self.buffer, self.pos)
+            if item_text is None:
+                break
+            self.pos = end
+            try:
+                items.append(json.loads(clean_escape(item_text), strict=False))
+            except json.JSONDecodeError:
+                self.dropped += 1
+        return items
+
+
+def parse_json_list(text: str) -> tuple[list, bool]:
+    """Parses a JSON list from model output, salvaging the valid items of a malformed or truncated list.
+
+    Returns the parsed items and whether the list was complete, i.e. closed and without dropped items.
+    """
+    text = strip_code_fence(text)
+    try:
+        parsed = json.loads(clean_escape(text), strict=False)
+        if isinstance(parsed, list):
+            return parsed, True
+    except json.JSONDecodeError:
+        pass
+
+    stream = JsonListStream()
+    items = stream.feed(text)
+    return items, stream.complete
@@ -1,8 +1,11 @@
 import asyncio
 
 from fact_eval.deduplicate import deduplicate
-from fact_eval.extract import extract
-from fact_eval.scrape import scrape
+from fact_eval.estimate import validate_sequential
+from fact_eval.extract import extract, extract_stream
+from fact_eval.llm import ModelRouter
+from fact_eval.scrape import scrape, scrape_
+from fact_eval.sources import SourceStore, default_sources
 from fact_eval.validate import validate
 
 test_report = """# # Анализ фигуры ректора и сравнение ОмГУ и ОмГПУ
@@ -265,12 +268,93 @@ By addressing these areas, Krott can effectively lead OmGU towards becoming a le
 """
 
 
-async def run_fact_pipeline(report_text: str) -> float:
-    extracted_dict = extract(report_text)
-    deduplicated_dict = deduplicate(extracted_dict)
-    scrapped_dict = await scrape(deduplicated_dict)
+async def extract_with_prefetch(
+    report_text: str,
+    router: ModelRouter | None = None,
+    sources: SourceStore | None = None,
+    max_prefetch: int = 4,
+) -> tuple[dict, dict[str, asyncio.Task]]:
+    # start scraping the url of every citation as soon as the streamed extraction emits it
+    semaphore = asyncio.Semaphore(max_prefetch)
+
+    async def prefetch(url):
+        async with semaphore:
+            return await scrape_([url], sources)
+
+    citations = []
+    prefetched = {}
+    try:
+        async for c in extract_stream(report_text, router):
+            citations.append(c)
+            url = c.get('url')
+            if isinstance(url, str) and url and url not in prefetched:
+                prefetched[url] = asyncio.create_task(prefetch(url))
+    except BaseException:
+        await cancel_prefetched(prefetched)
+        raise
+    return {'citations': citations}, prefetched
+
+
+async def cancel_prefetched(prefetched: dict[str, asyncio.Task]) -> None:
+    # scrapes that are still running are cancelled and awaited, so that none is left behind
+    # with an exception that was never retrieved
+    pending = [task for task in prefetched.values() if not task.done()]
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*prefetched.values(), return_exceptions=True)
+
+
+async def fill_prefetched(deduplicated_dict: dict, prefetched: dict[str, asyncio.Task]) -> None:
+    for task in prefetched.values():
+        try:
+            results = await task
+        except Exception as e:
+            # scrape() fetches the url again below
+            print(repr(e))
+            continue
+        for res in results:
+            if res['url'] in deduplicated_dict['citations_deduped']:
+                deduplicated_dict['citations_deduped'][res['url']]['url_content'] = res['url_content']
+
+
+async def run_fact_pipeline(
+    report_text: str,
+    ci_width: float | None = None,
+    confidence: float = 0.95,
+    order: str = 'random',
+    router: ModelRouter | None = None,
+    stream: bool = True,
+    sources: SourceStore | None = None,
+) -> float | dict:
+    # with ci_width set, url groups are validated in random or stratified order until the
+    # confidence interval on valid_rate is narrower than ci_width percentage points, and
+    # the estimate is returned together with the interval and the number of saved llm calls.
+    # pass one router to every report of a batch to collect per-model latency and token usage.
+    # pages saved by research runs (fact_eval.sources) are used instead of scraping them again
+    sources = sources or default_sources()
+    if stream:
+        extracted_dict, prefetched = await extract_with_prefetch(report_text, router, sources)
+        try:
+            # deduplication blocks on llm calls, run it in a thread so that prefetching goes on
+            deduplicated_dict = await asyncio.to_thread(deduplicate, extracted_dict, router)
+            await fill_prefetched(deduplicated_dict, prefetched)
+        finally:
+            await cancel_prefetched(prefetched)
+    else:
+        extracted_dict = await asyncio.to_thread(extract, report_text, router)
+        deduplicated_dict = await asyncio.to_thread(deduplicate, extracted_dict, router)
+    scrapped_dict = await scrape(deduplicated_dict, sources)
     print(scrapped_dict)
-    validated_dict = validate(scrapped_dict)
+
+    # validation blocks on llm calls, in a thread it does not stall other coroutines
+    # (e.g. research tasks running next to the scoring in run_queries --score)
+    if ci_width is not None:
+        return await asyncio.to_thread(
+            validate_sequential,
+            scrapped_dict, ci_width=ci_width, confidence=confidence, order=order, router=router
+        )
+
+    validated_dict = await asyncio.to_thread(validate, scrapped_dict, router)
 
     total_citations = 0
     total_valid_citations = 0
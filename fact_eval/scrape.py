@@ -1,12 +1,28 @@
-from gpt_researcher import GPTResearcher
-from gpt_researcher.actions.web_scraping import scrape_urls
-from gpt_researcher.utils.workers import WorkerPool
+import functools
 
-researcher = GPTResearcher(query="")
+from fact_eval.sources import SourceStore, default_sources
 
 
-async def scrape_(citations):
-    scraped_data, images = await scrape_urls(urls=citations, cfg=researcher.cfg, worker_pool=WorkerPool(1))
+@functools.cache
+def get_researcher():
+    # gpt_researcher is slow to import and to configure, so it is set up on the first scrape
+    from gpt_researcher import GPTResearcher
+
+    return GPTResearcher(query="")
+
+
+async def scrape_(citations, sources: SourceStore | None = None):
+    # pages the researcher already read while writing the report are taken from the source store
+    stored = sources.get_many(citations) if sources is not None else {}
+    scraped_data = [{'url': url, **page} for url, page in stored.items()]
+
+    missing = [url for url in citations if url not in stored]
+    if missing:
+        from gpt_researcher.actions.web_scraping import scrape_urls
+        from gpt_researcher.utils.workers import WorkerPool
+
+        fetched, images = await scrape_urls(urls=missing, cfg=get_researcher().cfg, worker_pool=WorkerPool(1))
+        scraped_data.extend(fetched)
 
     results = []
     for result in scraped_data:
@@ -22,10 +38,11 @@ async def scrape_(citations):
     return results
 
 
-async def scrape(deduplicated_dict: dict) -> dict:
+async def scrape(deduplicated_dict: dict, sources: SourceStore | None = None) -> dict:
+    sources = sources or default_sources()
     citations = list([k for k, v in deduplicated_dict['citations_deduped'].items() if 'url_content' not in v or not v['url_content']])
 
-    results = await scrape_(citations)
+    results = await scrape_(citations, sources) if citations else []
     scraped_dict = deduplicated_dict.copy()
     # update the url_content
     for res in results:
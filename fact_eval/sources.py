@@ -0,0 +1,90 @@
+import functools
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+SOURCES_PATH = Path("./data/interim/sources.sqlite")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+    url TEXT PRIMARY KEY,
+    title TEXT,
+    content TEXT NOT NULL,
+    fetched_at REAL NOT NULL
+);
+"""
+
+
+class SourceStore:
+    """Pages scraped by gpt-researcher while writing reports, keyed by url."""
+
+    def __init__(self, db_path: Path = SOURCES_PATH):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.db_path, timeout=60, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def put_many(self, scraped_data: list[dict]) -> None:
+        rows = [
+            (res['url'], res.get('title', ''), res['raw_content'], time.time())
+            for res in scraped_data
+            if res.get('url') and res.get('raw_content')
+        ]
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO sources (url, title, content, fetched_at) VALUES (?, ?, ?, ?)", rows
+            )
+
+    def get_many(self, urls: list[str]) -> dict[str, dict]:
+        found = {}
+        with self._lock:
+            # stay below sqlite's limit on the number of query parameters
+            for i in range(0, len(urls), 500):
+                batch = urls[i:i + 500]
+                rows = self.conn.execute(
+                    f"SELECT url, title, content FROM sources WHERE url IN ({', '.join('?' * len(batch))})", batch
+                ).fetchall()
+                for url, title, content in rows:
+                    found[url] = {'title': title, 'raw_content': content}
+        return found
+
+
+@functools.cache
+def _open_sources(db_path: Path) -> SourceStore:
+    return SourceStore(db_path)
+
+
+def default_sources() -> SourceStore | None:
+    return _open_sources(SOURCES_PATH) if SOURCES_PATH.exists() else None
+
+
+def install_source_capture(store: SourceStore) -> None:
+    # gpt_researcher has no hook for scraped pages, so scrape_urls is wrapped in every module
+    # that imported it by name; each page the researcher reads is saved to the store
+    import importlib
+
+    from gpt_researcher.actions import web_scraping
+
+    original = web_scraping.scrape_urls
+    if getattr(original, 'source_store', None) is store:
+        return
+
+    async def scrape_urls(*args, **kwargs):
+        scraped_data, images = await original(*args, **kwargs)
+        try:
+            store.put_many(scraped_data)
+        except Exception as e:
+            print(repr(e))
+        return scraped_data, images
+
+    scrape_urls.source_store = store
+    for module_name in ('gpt_researcher.actions.web_scraping', 'gpt_researcher.actions', 'gpt_researcher.skills.browser'):
+        try:
+            module = importlib.import_module(module_name)
+        except ImportError:
+            continue
+        if getattr(module, 'scrape_urls', None) is original:
+            module.scrape_urls = scrape_urls
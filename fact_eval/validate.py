@@ -1,8 +1,7 @@
 import time
 
-from langchain_core.output_parsers.json import JsonOutputParser
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_gigachat.chat_models import GigaChat
+from fact_eval.llm import ModelRouter, default_router, make_prompt
+from fact_eval.parsing import parse_json_list
 
 validate_prompt_template_en = """You will be provided with a reference and some statements. Please determine whether each statement is 'supported', 'unsupported', or 'unknown' with respect to the reference. Please note:
 First, assess whether the reference contains any valid content. If the reference contains no valid information, such as a 'page not found' message, then all statements should be considered 'unknown'.
@@ -32,7 +31,8 @@ Below are the reference and statements:
 Begin the assessment now. Output only the JSON list, without any conversational text or explanations."""
 
 
-def validate_(data):
+def validate_(data, router: ModelRouter | None = None):
+    router = router or default_router
     url = data[0]
     ref = data[1]['url_content']
     facts = data[1]['facts']
@@ -44,35 +44,43 @@ def validate_(data):
             "error": "no reference"
         }
 
-    facts_str = '\n'.join([f"{i+1}. {fact}" for i, fact in enumerate(facts)])
-
     retries = 0
     error = None
+    # escalate to the bigger model after a parse failure or a mismatched number of judgements
+    escalated = False
+    # judgements salvaged so far by statement index, a retry only asks about the missing statements
+    judgements: dict[int, str] = {}
 
-    validate_prompt = ChatPromptTemplate([
-        ("human", validate_prompt_template_en),
-    ])
-    llm = GigaChat(
-            model="GigaChat-2-Max",
-            verify_ssl_certs=False,
-            profanity_check=False
-        )
-    validate_chain = validate_prompt | llm | JsonOutputParser()
+    validate_prompt = make_prompt(validate_prompt_template_en)
     while retries < 3:
+        missing = [i for i in range(len(facts)) if i not in judgements]
+        facts_str = '\n'.join([f"{j+1}. {facts[i]}" for j, i in enumerate(missing)])
         try:
-            validate_res = validate_chain.invoke({"reference": ref, "statements": facts_str})
-
-            for _v in validate_res:
-                _v['idx'] -= 1
-            assert len(validate_res) == len(facts)
+            items, _ = parse_json_list(
+                router.invoke('validate', validate_prompt, {"reference": ref, "statements": facts_str}, escalated)
+            )
+
+            for _v in items:
+                if not isinstance(_v, dict) or 'result' not in _v:
+                    continue
+                try:
+                    idx = int(_v['idx']) - 1
+                except (KeyError, TypeError, ValueError):
+                    continue
+                if 0 <= idx < len(missing):
+                    judgements[missing[idx]] = _v['result']
+
+            if len(judgements) < len(facts):
+                raise ValueError(f"{len(facts) - len(judgements)} of {len(facts)} statements are not judged")
 
             return {
                 "url": url,
-                "validate_res": validate_res,
+                "validate_res": [{"idx": i, "result": judgements[i]} for i in range(len(facts))],
                 "error": None
             }
         except Exception as e:
             error = str(e)
+            escalated = True
             time.sleep(3)
             retries += 1
 
@@ -83,11 +91,11 @@ def validate_(data):
     }
 
 
-def validate(scraped_dict: dict) -> dict:
+def validate(scraped_dict: dict, router: ModelRouter | None = None) -> dict:
     # get the citations that need to be validated
     citations = [(k, v) for k, v in scraped_dict['citations_deduped'].items()]
 
-    results = [validate_(citation) for citation in citations]
+    results = [validate_(citation, router) for citation in citations]
     validated_dict = scraped_dict.copy()
     for res in results:
         validated_dict['citations_deduped'][res['url']]['validate_res'] = res['validate_res']
@@ -0,0 +1,210 @@
+import argparse
+import asyncio
+import re
+from datetime import datetime
+from itertools import product
+from pathlib import Path
+
+import pandas as pd
+from dotenv import find_dotenv, load_dotenv
+from pydantic import BaseModel, Field
+
+from fact_eval.llm import ModelRouter, RateLimiter, make_prompt
+from report_log import append_report, question_hash, read_reports
+
+load_dotenv(find_dotenv(".env"))
+
+INTERIM_DATA_PATH = Path("./data/interim")
+GENERATED_PATH = INTERIM_DATA_PATH / "generated_questions.jsonl"
+SELECTED_PATH = INTERIM_DATA_PATH / "selected_questions.json"
+
+PERSONAS = [
+    "Занятый специалист. Он явно торопится, используя сокращенный язык и минимум подробностей.",
+    "Начинающий. Он студент или новичок в теме, нуждается в объяснении «на пальцах».",
+    "Критик. Он любит заковыристые вопросы, придирается ко всему.",
+    "Любопытный. Он любит абстрактные или гипотетические вопросы.",
+]
+TOPICS = ["LLM", "Кибербезопасность", "Экономика", "Социология"]
+SCENARIOS = [
+    "Чёткий узконаправленный запрос",
+    "Неоднозначный вопрос",
+    "Многослойный вопрос",
+    "Запрос с ошибкой",
+    "Запрос на сравнение",
+]
+
+TEMPLATE = """Ты — эксперт по созданию реалистичных пользовательских запросов для тестирования ИИ-ассистентов.
+Твоя задача — сгенерировать 3 варианта различных запросов для подачи их в агента, занимающегося ресёрчем, соответствующих следующим параметрам:
+
+1. **Профиль пользователя**: {persona}
+2. **Тема**: {topic}
+3. **Тип запроса**: {scenario}
+
+**Инструкции**:
+- Учитывай особенности профиля
+- Адаптируй сложность и тон запроса под тематику.
+- Следуй указанному типу запроса
+- Избегай общих фраз — делай запросы конкретными."""
+
+
+class Question(BaseModel):
+    """Информация о запросе"""
+
+    question: str = Field(..., description="запрос, который ты создал на основе описания")
+
+
+class Queries(BaseModel):
+    """Информация о всех запросах, которые ты придумал для данного пользователя по данной теме"""
+
+    queries: list[Question]
+
+
+def combination_key(persona: str, topic: str, scenario: str) -> str:
+    return question_hash(f"{persona}\n{topic}\n{scenario}")
+
+
+async def generate_questions(
+    combinations: list[tuple[str, str, str]],
+    output_path: Path = GENERATED_PATH,
+    concurrency: int = 4,
+    rate: float = 1.0,
+    attempts: int = 3,
+    router: ModelRouter | None = None,
+) -> list[dict]:
+    # результат каждой комбинации сразу дописывается в output_path, при повторном запуске готовые пропускаются
+    router = router or ModelRouter()
+    prompt = make_prompt(TEMPLATE)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    done = {record["key"] for record in read_reports(output_path)}
+    semaphore = asyncio.Semaphore(concurrency)
+    limiter = RateLimiter(rate)
+
+    async def generate_one(persona: str, topic: str, scenario: str) -> dict | None:
+        inputs = {"persona": persona, "topic": topic, "scenario": scenario}
+        async with semaphore:
+            for attempt in range(attempts):
+                await limiter.wait()
+                try:
+                    queries = await router.ainvoke_structured("generate", prompt, inputs, Queries)
+                    break
+                except Exception as e:
+                    print(f"Generation failed for {persona[:30]!r}, {topic!r}, {scenario!r} (attempt {attempt + 1}): {e!r}")
+                    if attempt + 1 < attempts:
+                        await asyncio.sleep(2 ** attempt)
+            else:
+                return None
+        record = {
+            "key": combination_key(persona, topic, scenario),
+            **inputs,
+            "queries": [query.question for query in queries.queries],
+            "generation_time": datetime.now().isoformat(),
+        }
+        append_report(output_path, record)
+        return record
+
+    todo = [combination for combination in combinations if combination_key(*combination) not in done]
+    print(f"Generating {len(todo)} combinations, {len(combinations) - len(todo)} already done")
+    records = await asyncio.gather(*(generate_one(*combination) for combination in todo))
+    failed = sum(record is None for record in records)
+    if failed:
+        print(f"{failed} combinations failed, run again to retry them")
+    print(f"Usage by model: {router.usage_report()}")
+    return read_reports(output_path)
+
+
+def shingles(text: str, size: int = 2) -> set[tuple[str, ...]]:
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < size:
+        return {tuple(words)}
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def near_duplicates(questions: list[str], threshold: float = 0.6) -> set[int]:
+    """Индексы вопросов, у которых Жаккар по биграммам слов с одним из предыдущих вопросов не меньше threshold."""
+    # сравниваются только вопросы с общими биграммами, а не все пары
+    index: dict[tuple[str, ...], list[int]] = {}
+    kept_shingles: dict[int, set] = {}
+    duplicates = set()
+    for i, question in enumerate(questions):
+        current = shingles(question)
+        candidates = {j for shingle in current for j in index.get(shingle, ())}
+        if any(len(current & kept_shingles[j]) / len(current | kept_shingles[j]) >= threshold for j in candidates):
+            duplicates.add(i)
+            continue
+        kept_shingles[i] = current
+        for shingle in current:
+            index.setdefault(shingle, []).append(i)
+    return duplicates
+
+
+def embedding_duplicates(questions: list[str], threshold: float = 0.92) -> set[int]:
+    # эмбеддинги берутся из того же дискового кэша, что и для кластеризации заметок
+    from langchain_gigachat.embeddings import GigaChatEmbeddings
+
+    from error_clustering.embeddings import CustomEmbedder
+    from error_clustering.topics import normalize
+
+    embedder = CustomEmbedder(GigaChatEmbeddings(model="EmbeddingsGigaR", verify_ssl_certs=False))
+    similarities = normalize(embedder.embed(questions))
+    similarities = similarities @ similarities.T
+    duplicates = set()
+    for i in range(len(questions)):
+        kept = [j for j in range(i) if j not in duplicates]
+        if kept and similarities[i, kept].max() >= threshold:
+            duplicates.add(i)
+    return duplicates
+
+
+def select_questions(
+    records: list[dict],
+    output_path: Path = SELECTED_PATH,
+    threshold: float = 0.6,
+    embedding_threshold: float | None = None,
+) -> pd.DataFrame:
+    rows = [
+        {"question": query, "persona": record["persona"], "topic": record["topic"], "scenario": record["scenario"]}
+        for record in records
+        for query in record["queries"]
+    ]
+    df = pd.DataFrame(rows, columns=["question", "persona", "topic", "scenario"])
+    df = df.drop_duplicates("question").reset_index(drop=True)
+    duplicates = near_duplicates(df["question"].tolist(), threshold)
+    if embedding_threshold is not None:
+        kept = [i for i in range(len(df)) if i not in duplicates]
+        duplicates |= {kept[i] for i in embedding_duplicates(df["question"][kept].tolist(), embedding_threshold)}
+    selected = df.drop(index=sorted(duplicates))
+    print(f"{len(selected)} of {len(rows)} questions kept, {len(rows) - len(selected)} duplicates dropped")
+    # тот же формат, что читают run_queries.py и run_workers.py --enqueue
+    selected.to_json(output_path, orient="records", lines=True, force_ascii=False)
+    return selected
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Генерация синтетических вопросов по персонам, темам и сценариям")
+    parser.add_argument("--output", type=Path, default=GENERATED_PATH, help="JSONL с ответами по каждой комбинации")
+    parser.add_argument("--selected", type=Path, default=SELECTED_PATH)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=1.0, help="запросов к модели в секунду")
+    parser.add_argument("--threshold", type=float, default=0.6, help="Жаккар по биграммам слов, выше — дубликат")
+    parser.add_argument(
+        "--embedding-threshold",
+        type=float,
+        default=None,
+        help="дополнительно отбрасывать вопросы с косинусной близостью эмбеддингов выше порога",
+    )
+    return parser.parse_args()
+
+
+async def main():
+    args = parse_args()
+    records = await generate_questions(
+        list(product(PERSONAS, TOPICS, SCENARIOS)),
+        output_path=args.output,
+        concurrency=args.concurrency,
+        rate=args.rate,
+    )
+    select_questions(records, args.selected, args.threshold, args.embedding_threshold)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
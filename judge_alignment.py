@@ -0,0 +1,257 @@
+import argparse
+import asyncio
+import hashlib
+import re
+import sqlite3
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+from dotenv import find_dotenv, load_dotenv
+
+from fact_eval.llm import ModelRouter, RateLimiter, make_prompt
+from report_log import append_report
+
+load_dotenv(find_dotenv(".env"))
+
+EVAL_DATA_PATH = Path("./data/annotations/llm_judge_eval_data.csv")
+JUDGE_CACHE_PATH = Path("./data/interim/judge_cache.sqlite")
+RESULTS_PATH = Path("./data/processed/judge_results.jsonl")
+
+# промпт по умолчанию для спанов из ноутбука 07: input — промпт генерации поисковых запросов, output — ответ модели
+JUDGE_TEMPLATE = """Ты проверяешь работу агента, который по заданию составляет поисковые запросы в Google.
+
+**Задание агенту:**
+{input}
+
+**Ответ агента:**
+{output}
+
+Оцени, выполнил ли агент задание: запросы соответствуют теме задания, конкретны и оформлены в требуемом формате.
+Кратко объясни решение, а в последней строке напиши только одну метку из списка: {labels}."""
+
+CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS judgements (
+    key TEXT PRIMARY KEY,
+    answer TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+"""
+
+
+class JudgeCache:
+    """Ответы судьи по хэшу модели, промпта и строки: повторный прогон и другие промпты не платят за уже оценённое."""
+
+    def __init__(self, db_path: Path = JUDGE_CACHE_PATH):
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(CACHE_SCHEMA)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(model: str, template: str, inputs: dict) -> str:
+        text = "\0".join([model, template] + [f"{name}={inputs[name]}" for name in sorted(inputs)])
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            row = self.conn.execute("SELECT answer FROM judgements WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def put(self, key: str, answer: str) -> None:
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO judgements (key, answer, created_at) VALUES (?, ?, ?)",
+                (key, answer, datetime.now().isoformat()),
+            )
+
+
+def parse_label(answer: str, labels: list[str]) -> str | None:
+    # метка ищется с конца ответа: в рассуждении судья может упоминать и другие метки
+    for line in reversed(answer.strip().splitlines()):
+        found = [
+            (match.start(), label)
+            for label in labels
+            for match in re.finditer(rf"(?<!\w){re.escape(label)}(?!\w)", line, re.IGNORECASE)
+        ]
+        if found:
+            return max(found)[1]
+    return None
+
+
+@dataclass
+class Agreement:
+    """Согласие судьи с разметкой, positive — метка, которую судья должен находить (например, ошибка)."""
+
+    positive: str
+    tp: int = 0
+    fp: int = 0
+    fn: int = 0
+    tn: int = 0
+    unparsed: int = 0
+    failed: int = 0
+
+    def add(self, human: str, judge: str | None) -> None:
+        if judge is None:
+            self.unparsed += 1
+            return
+        if judge == self.positive:
+            if human == self.positive:
+                self.tp += 1
+            else:
+                self.fp += 1
+        elif human == self.positive:
+            self.fn += 1
+        else:
+            self.tn += 1
+
+    @property
+    def total(self) -> int:
+        return self.tp + self.fp + self.fn + self.tn
+
+    @property
+    def agreement(self) -> float:
+        return (self.tp + self.tn) / self.total if self.total else 0.0
+
+    @property
+    def precision(self) -> float:
+        return self.tp / (self.tp + self.fp) if self.tp + self.fp else 0.0
+
+    @property
+    def recall(self) -> float:
+        return self.tp / (self.tp + self.fn) if self.tp + self.fn else 0.0
+
+    def summary(self) -> dict:
+        return {
+            "n": self.total,
+            "agreement": round(self.agreement, 3),
+            "precision": round(self.precision, 3),
+            "recall": round(self.recall, 3),
+            "unparsed": self.unparsed,
+            "failed": self.failed,
+        }
+
+
+def load_eval_data(path: Path = EVAL_DATA_PATH) -> pd.DataFrame:
+    df = pd.read_csv(path, dtype={"label": str})
+    df = df.drop(columns=[c for c in df.columns if c.startswith("Unnamed: ")])
+    df["label"] = df["label"].fillna("").str.strip().str.lower()
+    # строки без разметки не участвуют в сравнении
+    return df.loc[df["label"] != ""].reset_index(drop=True)
+
+
+async def run_judges(
+    df: pd.DataFrame,
+    prompts: dict[str, str],
+    positive: str,
+    concurrency: int = 8,
+    rate: float = 5.0,
+    router: ModelRouter | None = None,
+    cache: JudgeCache | None = None,
+    results_path: Path | None = RESULTS_PATH,
+    report_every: int = 50,
+) -> dict[str, Agreement]:
+    # метрики обновляются по мере прихода ответов, промежуточные печатаются каждые report_every ответов
+    router = router or ModelRouter()
+    cache = cache if cache is not None else JudgeCache()
+    model = router.model_for("judge")
+    labels = sorted(df["label"].unique())
+    semaphore = asyncio.Semaphore(concurrency)
+    limiter = RateLimiter(rate)
+    metrics = {name: Agreement(positive) for name in prompts}
+    chat_prompts = {name: make_prompt(template) for name, template in prompts.items()}
+    if results_path is not None:
+        results_path.parent.mkdir(parents=True, exist_ok=True)
+
+    async def judge(name: str, template: str, row: dict) -> tuple[str, dict, str | None]:
+        inputs = {"input": row["input"], "output": row["output"], "labels": ", ".join(labels)}
+        key = JudgeCache.key(model, template, inputs)
+        answer = cache.get(key)
+        if answer is None:
+            async with semaphore:
+                await limiter.wait()
+                try:
+                    answer = await router.ainvoke("judge", chat_prompts[name], inputs)
+                except Exception as e:
+                    print(f"[{name}] judge failed for {row['id']}: {e!r}")
+                    return name, row, None
+            cache.put(key, answer)
+        return name, row, answer
+
+    tasks = [
+        asyncio.create_task(judge(name, template, row))
+        for name, template in prompts.items()
+        for row in df.to_dict("records")
+    ]
+    for done, task in enumerate(asyncio.as_completed(tasks), start=1):
+        name, row, answer = await task
+        if answer is None:
+            # неудачный вызов не попадает в кэш и будет повторён при следующем запуске
+            metrics[name].failed += 1
+        else:
+            judge_label = parse_label(answer, labels)
+            metrics[name].add(row["label"], judge_label)
+        if results_path is not None and answer is not None:
+            append_report(results_path, {
+                "prompt": name, "model": model, "id": row["id"],
+                "label": row["label"], "judge_label": judge_label, "answer": answer,
+            })
+        if done % report_every == 0 or done == len(tasks):
+            print(f"[{done}/{len(tasks)}] " + " | ".join(
+                f"{name}: agreement={m.agreement:.2f} precision={m.precision:.2f} recall={m.recall:.2f}"
+                for name, m in metrics.items()
+            ))
+    return metrics
+
+
+def load_prompts(paths: list[Path]) -> dict[str, str]:
+    if not paths:
+        return {"default": JUDGE_TEMPLATE}
+    prompts = {}
+    for path in paths:
+        template = path.read_text(encoding="utf-8")
+        missing = [field for field in ("{input}", "{output}") if field not in template]
+        if missing:
+            raise ValueError(f"{path} has no {', '.join(missing)}")
+        prompts[path.stem] = template
+    return prompts
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Сравнение промптов LLM-судьи с ручной разметкой")
+    parser.add_argument("--data", type=Path, default=EVAL_DATA_PATH)
+    parser.add_argument(
+        "--prompt",
+        type=Path,
+        nargs="*",
+        default=[],
+        help="файлы с промптами судьи с полями {input}, {output} и {labels}; без них — промпт по умолчанию",
+    )
+    parser.add_argument("--positive", required=True, help="метка, которую должен находить судья, например bad")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=5.0, help="запросов к модели в секунду")
+    parser.add_argument("--model", default=None, help="модель судьи, по умолчанию модель ModelRouter")
+    parser.add_argument("--results", type=Path, default=RESULTS_PATH)
+    return parser.parse_args()
+
+
+async def main():
+    args = parse_args()
+    df = load_eval_data(args.data)
+    positive = args.positive.strip().lower()
+    if positive not in set(df["label"]):
+        raise SystemExit(f"no rows labelled {positive!r}, labels in {args.data}: {sorted(df['label'].unique())}")
+    router = ModelRouter({"judge": args.model} if args.model else None)
+    metrics = await run_judges(
+        df, load_prompts(args.prompt), positive,
+        concurrency=args.concurrency, rate=args.rate, router=router, results_path=args.results,
+    )
+    print(pd.DataFrame({name: m.summary() for name, m in metrics.items()}).T.to_string())
+    print(f"Usage by model: {router.usage_report()}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,206 @@
+"""Parse gpt-researcher log files into a Parquet dataset, in parallel and incrementally.
+
+python -m log_analysis.parse data/logs/2025-06-16-logs.log --workers 8
+python -m log_analysis.parse data/logs/current.log --follow
+"""
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import re
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+LOGS_PATH = Path("./data/processed/logs")
+STATE_NAME = "_state.json"
+
+# same fields as parse_multiline_logs in notebook 02
+ENTRY_RE = re.compile(
+    rb'^\[(?P<timestamp>\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2},\d{3})\] '
+    rb'\[(?P<module_info>.+?):(?P<line_number>\d+)\] '
+    rb'\[(?P<log_level>[A-Z]+)\] ',
+    re.MULTILINE,
+)
+
+SCHEMA = pa.schema([
+    ("timestamp", pa.timestamp("ms")),
+    ("file_path", pa.string()),
+    ("line_number", pa.int32()),
+    ("module_name", pa.string()),
+    ("log_level", pa.dictionary(pa.int8(), pa.string())),
+    ("data", pa.string()),
+    ("offset", pa.int64()),
+])
+
+MIN_CHUNK_SIZE = 8 * 1024 * 1024
+HEAD_SIZE = 4096
+
+
+def next_entry_start(buffer, position: int, end: int) -> int:
+    # '^' only matches after a newline, so a search from the middle of a line skips to the next entry
+    match = ENTRY_RE.search(buffer, position, end)
+    return match.start() if match else end
+
+
+def last_entry_start(buffer, start: int, end: int) -> int:
+    position = end
+    while position > start:
+        position = buffer.rfind(b"\n[", start, position)
+        if position == -1:
+            break
+        if ENTRY_RE.match(buffer, position + 1):
+            return position + 1
+    return start
+
+
+def split_chunks(buffer, start: int, end: int, workers: int) -> list[tuple[int, int]]:
+    size = max(MIN_CHUNK_SIZE, (end - start) // max(workers, 1) + 1)
+    bounds = [next_entry_start(buffer, start, end)]
+    while bounds[-1] < end:
+        bounds.append(next_entry_start(buffer, min(bounds[-1] + size, end), end))
+    return [(a, b) for a, b in zip(bounds, bounds[1:]) if a < b]
+
+
+def parse_chunk(path: str, start: int, end: int) -> pa.Table:
+    # runs in a worker process; the chunk starts at an entry and ends right before the next one
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        matches = list(ENTRY_RE.finditer(buffer, start, end))
+        columns = {name: [] for name in ("timestamp", "module_info", "line_number", "log_level", "data", "offset")}
+        for i, match in enumerate(matches):
+            data_end = matches[i + 1].start() if i + 1 < len(matches) else end
+            text = buffer[match.end():data_end].decode("utf-8", errors="replace")
+            columns["timestamp"].append(match["timestamp"].decode())
+            columns["module_info"].append(match["module_info"].decode("utf-8", errors="replace"))
+            columns["line_number"].append(int(match["line_number"]))
+            columns["log_level"].append(match["log_level"].decode())
+            columns["data"].append("\n".join(line.strip() for line in text.splitlines()))
+            columns["offset"].append(match.start())
+
+    df = pd.DataFrame(columns)
+    df["timestamp"] = pd.to_datetime(df["timestamp"], format="%Y-%m-%d %H:%M:%S,%f")
+    df["file_path"] = df.pop("module_info")
+    df["module_name"] = df["file_path"].str.rsplit(".", n=1).str[-1]
+    return pa.Table.from_pandas(df[SCHEMA.names], schema=SCHEMA, preserve_index=False)
+
+
+def write_chunk(path: str, start: int, end: int, output_dir: str) -> int:
+    table = parse_chunk(path, start, end)
+    part = Path(output_dir) / f"part-{start:016d}.parquet"
+    tmp_part = part.with_name("." + part.name)
+    pq.write_table(table, tmp_part)
+    os.replace(tmp_part, part)
+    return table.num_rows
+
+
+class LogParser:
+    """Parses one log file into output_dir/part-<byte offset>.parquet.
+
+    The file is memory-mapped and split at entry starts into chunks that are parsed in a process pool.
+    _state.json keeps the parsed byte offset, so the next run only parses what was appended.
+    A file that shrank or whose first bytes changed (rotation) is parsed again from the start.
+    """
+
+    def __init__(self, log_path: Path, output_dir: Path | None = None, workers: int | None = None):
+        self.log_path = Path(log_path)
+        self.output_dir = Path(output_dir) if output_dir else LOGS_PATH / self.log_path.stem
+        self.workers = workers or os.cpu_count()
+        self.state_path = self.output_dir / STATE_NAME
+
+    def load_state(self) -> dict:
+        if not self.state_path.exists():
+            return {"offset": 0, "head": None}
+        with open(self.state_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def save_state(self, state: dict):
+        tmp_path = self.state_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.state_path)
+
+    def reset(self):
+        shutil.rmtree(self.output_dir, ignore_errors=True)
+
+    def update(self, hold_last: bool = False) -> int:
+        """Parses the bytes appended since the last run and returns the number of new entries.
+
+        With hold_last the last entry is left for the next run, because lines may still be appended to it.
+        """
+        size = self.log_path.stat().st_size
+        if size == 0:
+            return 0
+        with open(self.log_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            head = hashlib.sha1(buffer[:HEAD_SIZE]).hexdigest()
+            state = self.load_state()
+            if state["head"] is not None and (state["head"] != head or state["offset"] > size):
+                print(f"{self.log_path} was rotated or truncated, parsing it again")
+                self.reset()
+                state = {"offset": 0, "head": None}
+            # the head grows until the file is HEAD_SIZE bytes long, compare it only once it is full
+            state["head"] = head if size >= HEAD_SIZE else None
+
+            end = size
+            if hold_last:
+                end = last_entry_start(buffer, state["offset"], size)
+            chunks = split_chunks(buffer, state["offset"], end, self.workers)
+
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        if len(chunks) <= 1:
+            counts = [write_chunk(str(self.log_path), a, b, str(self.output_dir)) for a, b in chunks]
+        else:
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                counts = list(executor.map(
+                    write_chunk,
+                    *zip(*[(str(self.log_path), a, b, str(self.output_dir)) for a, b in chunks])
+                ))
+        if chunks:
+            state["offset"] = chunks[-1][1]
+        self.save_state(state)
+        return sum(counts)
+
+    def follow(self, interval: float = 5.0):
+        while True:
+            new_entries = self.update(hold_last=True)
+            if new_entries:
+                print(f"{self.log_path}: +{new_entries} entries")
+            time.sleep(interval)
+
+
+def load_logs(output_dir: Path, columns: list[str] | None = None, filters=None) -> pd.DataFrame:
+    # pyarrow skips _state.json and parts that are still being written, parts are ordered by offset
+    return pq.read_table(output_dir, columns=columns, filters=filters).to_pandas()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Разбирает лог gpt-researcher в Parquet, дописывая только новые строки")
+    parser.add_argument("log", type=Path)
+    parser.add_argument("--output", type=Path, default=None, help="по умолчанию data/processed/logs/<имя лога>")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--follow", action="store_true", help="следить за логом и разбирать новые записи")
+    parser.add_argument("--interval", type=float, default=5.0)
+    parser.add_argument("--full", action="store_true", help="разобрать лог заново с начала")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    parser = LogParser(args.log, args.output, args.workers)
+    if args.full:
+        parser.reset()
+    if args.follow:
+        parser.follow(args.interval)
+    else:
+        start = time.perf_counter()
+        new_entries = parser.update()
+        print(f"{new_entries} new entries in {parser.output_dir} ({time.perf_counter() - start:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""Error signatures over parsed logs: module:line plus a message template with numbers and urls masked.
+
+python -m log_analysis.signatures data/processed/logs/2025-06-16-logs --level ERROR --top 20
+"""
+import argparse
+import hashlib
+import json
+import sqlite3
+from pathlib import Path
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+INDEX_NAME = "_signatures.sqlite"
+LEVELS = ("ERROR", "CRITICAL", "WARNING")
+MAX_SAMPLES = 5
+MAX_TEMPLATE_LENGTH = 300
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS signatures (
+    signature TEXT PRIMARY KEY,
+    file_path TEXT NOT NULL,
+    line_number INTEGER NOT NULL,
+    log_level TEXT NOT NULL,
+    template TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    first_seen TEXT NOT NULL,
+    last_seen TEXT NOT NULL,
+    samples TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS signatures_location ON signatures (file_path, line_number);
+CREATE TABLE IF NOT EXISTS indexed_parts (name TEXT PRIMARY KEY);
+"""
+
+# order matters: urls and uuids are masked before the numbers inside them
+MASKS = [
+    (r"https?://\S+", "<URL>"),
+    (r"\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b", "<UUID>"),
+    (r"\b0x[0-9a-fA-F]+\b|\b[0-9a-fA-F]{16,}\b", "<HEX>"),
+    (r"\d+(?:\.\d+)?", "<NUM>"),
+]
+
+
+def message_templates(data: pd.Series) -> pd.Series:
+    # only the first line: tracebacks that follow it differ between otherwise identical errors
+    templates = data.str.split("\n", n=1).str[0].str.slice(0, MAX_TEMPLATE_LENGTH)
+    for pattern, mask in MASKS:
+        templates = templates.str.replace(pattern, mask, regex=True)
+    return templates.str.strip()
+
+
+def signature_id(file_path: str, line_number: int, log_level: str, template: str) -> str:
+    return hashlib.sha1(f"{file_path}:{line_number}|{log_level}|{template}".encode()).hexdigest()[:16]
+
+
+class SignatureIndex:
+    """Pre-aggregated error signatures for a directory written by log_analysis.parse.
+
+    update() only reads the Parquet parts that were not indexed yet, so triage queries
+    cost O(signatures) instead of a scan over every log line.
+    """
+
+    def __init__(self, logs_dir: Path, levels: tuple[str, ...] = LEVELS):
+        self.logs_dir = Path(logs_dir)
+        self.levels = levels
+        self.conn = sqlite3.connect(self.logs_dir / INDEX_NAME)
+        self.conn.executescript(SCHEMA)
+
+    def update(self) -> int:
+        indexed = {name for (name,) in self.conn.execute("SELECT name FROM indexed_parts")}
+        parts = sorted(path for path in self.logs_dir.glob("part-*.parquet") if path.name not in indexed)
+        for path in parts:
+            entries = pq.read_table(
+                path,
+                columns=["timestamp", "file_path", "line_number", "log_level", "data"],
+                filters=[("log_level", "in", list(self.levels))],
+            ).to_pandas()
+            with self.conn:
+                self._add(entries)
+                self.conn.execute("INSERT INTO indexed_parts (name) VALUES (?)", (path.name,))
+        return len(parts)
+
+    def _add(self, entries: pd.DataFrame):
+        if entries.empty:
+            return
+        entries["log_level"] = entries["log_level"].astype(str)
+        entries["template"] = message_templates(entries["data"])
+        groups = entries.groupby(["file_path", "line_number", "log_level", "template"], sort=False).agg(
+            count=("data", "size"),
+            first_seen=("timestamp", "min"),
+            last_seen=("timestamp", "max"),
+            samples=("data", lambda data: list(data.drop_duplicates().head(MAX_SAMPLES))),
+        )
+        keys = [signature_id(*key) for key in groups.index]
+        existing = {}
+        for i in range(0, len(keys), 500):
+            batch = keys[i:i + 500]
+            rows = self.conn.execute(
+                f"SELECT signature, samples FROM signatures WHERE signature IN ({', '.join('?' * len(batch))})", batch
+            ).fetchall()
+            existing.update((signature, json.loads(samples)) for signature, samples in rows)
+
+        rows = []
+        aggregates = groups.itertuples(index=False, name=None)
+        for key, (file_path, line_number, log_level, template), aggregate in zip(keys, groups.index, aggregates):
+            count, first_seen, last_seen, new_samples = aggregate
+            samples = existing.get(key, [])
+            samples += [sample for sample in new_samples if sample not in samples]
+            rows.append((
+                key, file_path, int(line_number), log_level, template, int(count),
+                first_seen.isoformat(), last_seen.isoformat(),
+                json.dumps(samples[:MAX_SAMPLES], ensure_ascii=False),
+            ))
+        self.conn.executemany(
+            "INSERT INTO signatures (signature, file_path, line_number, log_level, template, count, "
+            "first_seen, last_seen, samples) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(signature) DO UPDATE SET count = count + excluded.count, "
+            "first_seen = min(first_seen, excluded.first_seen), last_seen = max(last_seen, excluded.last_seen), "
+            "samples = excluded.samples",
+            rows,
+        )
+
+    def top(
+        self,
+        level: str | None = None,
+        file_path: str | None = None,
+        line_number: int | None = None,
+        limit: int | None = 50,
+    ) -> pd.DataFrame:
+        conditions, params = [], []
+        for column, value in (("log_level", level), ("file_path", file_path), ("line_number", line_number)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        query = "SELECT * FROM signatures"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY count DESC"
+        if limit:
+            query += f" LIMIT {int(limit)}"
+        signatures = pd.read_sql_query(query, self.conn, params=params)
+        signatures["samples"] = signatures["samples"].map(json.loads)
+        return signatures
+
+    def by_location(self, level: str | None = None) -> pd.DataFrame:
+        # replaces errors_df[["file_path", "line_number"]].value_counts() from notebook 02
+        query = "SELECT file_path, line_number, SUM(count) AS count, COUNT(*) AS templates FROM signatures"
+        params = []
+        if level is not None:
+            query += " WHERE log_level = ?"
+            params.append(level)
+        query += " GROUP BY file_path, line_number ORDER BY count DESC"
+        return pd.read_sql_query(query, self.conn, params=params)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Обновляет индекс сигнатур ошибок и показывает самые частые")
+    parser.add_argument("logs_dir", type=Path, help="папка, в которую log_analysis.parse разобрал лог")
+    parser.add_argument("--level", default=None)
+    parser.add_argument("--file-path", default=None)
+    parser.add_argument("--line-number", type=int, default=None)
+    parser.add_argument("--top", type=int, default=20)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    index = SignatureIndex(args.logs_dir)
+    print(f"indexed {index.update()} new parts")
+    with pd.option_context("display.max_colwidth", 120, "display.width", 200):
+        print(index.top(args.level, args.file_path, args.line_number, args.top)[
+            ["file_path", "line_number", "log_level", "count", "last_seen", "template"]
+        ].to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
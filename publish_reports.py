@@ -0,0 +1,78 @@
+import argparse
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from report_log import read_reports
+
+PUBLISH_PATH = Path("./outputs/published")
+
+
+def publish_report(report_text: str, output_dir: str, formats: list[str]) -> dict[str, str]:
+    # выполняется в отдельном процессе: weasyprint и docx не держат процесс с исследованиями
+    from multi_agents.agents.utils.file_formats import write_md_to_pdf, write_md_to_word
+
+    writers = {"pdf": write_md_to_pdf, "docx": write_md_to_word}
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    return {fmt: asyncio.run(writers[fmt](report_text, output_dir)) for fmt in formats}
+
+
+def publish_reports(
+    reports_path: Path,
+    formats: list[str],
+    question_hashes: set[str] | None = None,
+    workers: int = 4,
+    output_path: Path = PUBLISH_PATH,
+) -> dict[str, dict]:
+    records = [
+        record for record in read_reports(reports_path)
+        if record.get("error") is None and (not question_hashes or record["question_hash"] in question_hashes)
+    ]
+    print(f"Publishing {len(records)} reports as {', '.join(formats)}")
+
+    published = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(
+                publish_report,
+                record["report"]["report"],
+                str(output_path / record["question_hash"]),
+                formats,
+            ): record["question_hash"]
+            for record in records
+        }
+        for future in as_completed(futures):
+            question_hash = futures[future]
+            try:
+                published[question_hash] = future.result()
+            except Exception as e:
+                print(f"Publishing failed for {question_hash}: {e!r}")
+                published[question_hash] = {"error": repr(e)}
+    return published
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Собирает PDF/DOCX для отчётов из JSONL, записанного run_queries.py")
+    parser.add_argument("reports", type=Path, help="research_reports_<дата>.jsonl")
+    parser.add_argument("--formats", nargs="+", choices=["pdf", "docx"], default=["pdf", "docx"])
+    parser.add_argument("--question-hash", nargs="*", default=None, help="только эти отчёты (по умолчанию все)")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--output", type=Path, default=PUBLISH_PATH)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    published = publish_reports(
+        args.reports,
+        args.formats,
+        question_hashes=set(args.question_hash) if args.question_hash else None,
+        workers=args.workers,
+        output_path=args.output,
+    )
+    for question_hash, paths in published.items():
+        print(question_hash, paths)
+
+
+if __name__ == "__main__":
+    main()
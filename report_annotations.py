@@ -0,0 +1,187 @@
+import hashlib
+import json
+import pickle
+import sqlite3
+import threading
+from collections.abc import Sequence
+from datetime import datetime
+from pathlib import Path
+
+REPORT_ANNOTATIONS_PATH = Path("./data/annotations/report_annotations.sqlite")
+# меняется при изменении render_markdown, чтобы закэшированный HTML пересобрался
+RENDERER_VERSION = "markdown-tables-1"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reports (
+    report_hash TEXT PRIMARY KEY,
+    question TEXT NOT NULL,
+    example TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS rendered (
+    report_hash TEXT PRIMARY KEY,
+    renderer TEXT NOT NULL,
+    html TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS imports (
+    path TEXT PRIMARY KEY,
+    version TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS annotations (
+    report_hash TEXT PRIMARY KEY,
+    label TEXT,
+    notes TEXT,
+    data TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+"""
+
+
+def example_question(example: dict) -> str:
+    return example['inputs']['task']['query']
+
+
+def example_report(example: dict) -> str:
+    return example['outputs']['report']
+
+
+def report_hash(example: dict) -> str:
+    text = example_question(example) + "\0" + example_report(example)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def render_markdown(example: dict) -> str:
+    import markdown
+    from markdown.extensions.tables import TableExtension
+
+    return markdown.markdown(
+        "**Вопрос: **" + example_question(example) + '\n\n\n**Отчет:**\n\n' + example_report(example),
+        extensions=[TableExtension()]
+    )
+
+
+class LazyExamples(Sequence):
+    """Отчёты в порядке импорта; JSON отчёта читается из базы только при обращении к нему."""
+
+    def __init__(self, store: "ReportAnnotationStore", hashes: list[str]):
+        self.store = store
+        self.hashes = hashes
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.store.example(h) for h in self.hashes[index]]
+        return self.store.example(self.hashes[index])
+
+
+class ReportAnnotationStore:
+    """Отчёты, их разметка и отрендеренный HTML в одной SQLite базе вместо JSON со всеми отчётами и pkl с разметкой.
+
+    Разметка хранится построчно по хэшу отчёта: label и notes отдельными колонками, остальное — JSON.
+    HTML кэшируется по хэшу отчёта, поэтому markdown каждого отчёта рендерится один раз.
+    """
+
+    def __init__(self, db_path: Path = REPORT_ANNOTATIONS_PATH):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def import_examples(self, examples: list[dict]) -> list[str]:
+        rows = [
+            (report_hash(example), example_question(example), json.dumps(example, ensure_ascii=False))
+            for example in examples
+        ]
+        with self._lock, self.conn:
+            self.conn.executemany("INSERT OR IGNORE INTO reports (report_hash, question, example) VALUES (?, ?, ?)", rows)
+        return [row[0] for row in rows]
+
+    def import_json(self, path: Path) -> int:
+        # большой JSON с отчётами разбирается, только если он изменился с прошлого импорта
+        path = Path(path)
+        stat = path.stat()
+        version = f"{stat.st_size}:{stat.st_mtime_ns}"
+        with self._lock:
+            row = self.conn.execute("SELECT version FROM imports WHERE path = ?", (str(path.resolve()),)).fetchone()
+        if row is not None and row[0] == version:
+            return 0
+        with open(path, encoding="utf-8") as f:
+            imported = len(self.import_examples(json.load(f)))
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO imports (path, version) VALUES (?, ?)", (str(path.resolve()), version)
+            )
+        return imported
+
+    def examples(self, hashes: list[str] | None = None) -> LazyExamples:
+        if hashes is None:
+            with self._lock:
+                hashes = [h for (h,) in self.conn.execute("SELECT report_hash FROM reports ORDER BY rowid")]
+        return LazyExamples(self, hashes)
+
+    def example(self, report_hash: str) -> dict:
+        with self._lock:
+            (example,) = self.conn.execute("SELECT example FROM reports WHERE report_hash = ?", (report_hash,)).fetchone()
+        return json.loads(example)
+
+    def render(self, example: dict) -> str:
+        key = report_hash(example)
+        with self._lock:
+            row = self.conn.execute("SELECT renderer, html FROM rendered WHERE report_hash = ?", (key,)).fetchone()
+        if row is not None and row[0] == RENDERER_VERSION:
+            return row[1]
+        html = render_markdown(example)
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO rendered (report_hash, renderer, html) VALUES (?, ?, ?)",
+                (key, RENDERER_VERSION, html),
+            )
+        return html
+
+    def save_annotations(self, annotations: list[dict], examples: Sequence[dict] | None = None) -> int:
+        # аннотация molabel содержит сам пример или его индекс в examples
+        now = datetime.now().isoformat()
+        rows = []
+        for annotation in annotations:
+            if 'example' in annotation:
+                example = annotation['example']
+            elif examples is not None and 'index' in annotation:
+                example = examples[annotation['index']]
+            else:
+                raise ValueError(f"can't match the annotation to a report: {sorted(annotation)}")
+            data = {key: value for key, value in annotation.items() if key != 'example'}
+            rows.append((
+                report_hash(example), annotation.get('_label'), annotation.get('_notes'),
+                json.dumps(data, ensure_ascii=False, default=str), now,
+            ))
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "INSERT INTO annotations (report_hash, label, notes, data, updated_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(report_hash) DO UPDATE SET label = excluded.label, notes = excluded.notes, "
+                "data = excluded.data, updated_at = excluded.updated_at",
+                rows,
+            )
+        return len(rows)
+
+    def import_pickle(self, path: Path, examples: Sequence[dict] | None = None) -> int:
+        # перенос старой разметки из annotations_<дата>.pkl
+        with open(path, 'rb') as f:
+            annotations = pickle.load(f)
+        self.import_examples([annotation['example'] for annotation in annotations if 'example' in annotation])
+        return self.save_annotations(annotations, examples)
+
+    def load_annotations(self, with_examples: bool = False) -> list[dict]:
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT a.report_hash, a.data FROM annotations a JOIN reports r USING (report_hash) ORDER BY r.rowid"
+            ).fetchall()
+        annotations = []
+        for key, data in rows:
+            annotation = json.loads(data)
+            if with_examples:
+                annotation['example'] = self.example(key)
+            annotations.append(annotation)
+        return annotations
@@ -0,0 +1,51 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+
+def question_hash(question: str) -> str:
+    return hashlib.sha256(question.encode("utf-8")).hexdigest()[:16]
+
+
+def read_reports(output_path: Path) -> list[dict]:
+    # записи с одним question_hash (отчёт и дописанная позже оценка, повтор после ошибки) сливаются в одну,
+    # более поздние поля перекрывают ранние; записи без question_hash возвращаются как есть
+    if not output_path.exists():
+        return []
+    records = []
+    by_hash = {}
+    with open(output_path, encoding="utf-8") as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # строка, недописанная при падении прогона
+                continue
+            key = record.get("question_hash")
+            if key is None:
+                records.append(record)
+            elif key in by_hash:
+                by_hash[key].update(record)
+            else:
+                by_hash[key] = record
+                records.append(record)
+    return records
+
+
+def append_report(output_path: Path, record: dict):
+    with open(output_path, "a", encoding="utf-8") as file:
+        file.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        file.flush()
+        os.fsync(file.fileno())
+
+
+def prepare_output(output_path: Path) -> set[str]:
+    # возвращает хэши уже готовых вопросов, вопросы с ошибкой прогоняются заново
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    if output_path.exists() and output_path.stat().st_size > 0:
+        with open(output_path, "rb+") as file:
+            file.seek(-1, os.SEEK_END)
+            if file.read(1) != b"\n":
+                file.write(b"\n")
+    return {record["question_hash"] for record in read_reports(output_path) if record.get("error") is None}
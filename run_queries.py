@@ -1,4 +1,6 @@
+import argparse
 import asyncio
+import copy
 import json
 from datetime import datetime
 from pathlib import Path
@@ -6,81 +8,191 @@ from pathlib import Path
 import pandas as pd
 from dotenv import find_dotenv, load_dotenv
 from multi_agents.agents import ChiefEditorAgent
-from openinference.instrumentation.langchain import LangChainInstrumentor
-from phoenix.otel import register
+
+from fact_eval.llm import ModelRouter
+from fact_eval.pipeline import run_fact_pipeline
+from fact_eval.sources import SOURCES_PATH, SourceStore, install_source_capture
+from report_log import append_report, prepare_output, question_hash, read_reports
+from tracing import add_tracing_args, setup_tracing_from_args
 
 load_dotenv(find_dotenv(".env"))
 
 DATA_PATH = Path("./data")
 INTERIM_DATA_PATH = DATA_PATH / "interim"
 
-tracer_provider = register(
-  project_name="gpt-researcher",
-  endpoint="http://localhost:6006/v1/traces",
-)
-
-LangChainInstrumentor().instrument(tracer_provider=tracer_provider)
-
-
-async def run_queries(questions):
-    task = {
-        "max_sections": 3,
-        "publish_formats": {
-            "markdown": True,
-            "pdf": True,
-            "docx": True,
-        },
-        "include_human_feedback": False,
-        "follow_guidelines": False,
-        "model": "gigachat:GigaChat-2-Max",
-        "guidelines": [],
-        "language": "russian",
-        "verbose": True,
-    }
-
-    research_reports = []
-
-    for question in questions:
-        task["query"] = question
-        chief_editor = ChiefEditorAgent(task)
-        research_report = await chief_editor.run_research_task()
-        research_reports.append(research_report)
-
-    return research_reports
-
-
-async def run_query(question):
-    task = {
-        "max_sections": 3,
-        "publish_formats": {
-            "markdown": True,
-            "pdf": True,
-            "docx": True,
-        },
-        "include_human_feedback": False,
-        "follow_guidelines": False,
-        "model": "gigachat:GigaChat-2-Max",
-        "guidelines": [],
-        "language": "russian",
-        "verbose": True,
-    }
-
-    research_reports = []
-
+TASK_TEMPLATE = {
+    "max_sections": 3,
+    "publish_formats": {
+        "markdown": True,
+        "pdf": True,
+        "docx": True,
+    },
+    "include_human_feedback": False,
+    "follow_guidelines": False,
+    "model": "gigachat:GigaChat-2-Max",
+    "guidelines": [],
+    "language": "russian",
+    "verbose": True,
+}
+
+
+def make_task(question: str, markdown_only: bool = False) -> dict:
+    # у каждого вопроса свой task, ChiefEditorAgent хранит и дополняет его во время работы
+    task = copy.deepcopy(TASK_TEMPLATE)
     task["query"] = question
-    chief_editor = ChiefEditorAgent(task)
-    research_report = await chief_editor.run_research_task()
-    research_reports.append(research_report)
-
-    return research_reports
+    if markdown_only:
+        # pdf и docx можно собрать потом отдельно: python publish_reports.py
+        task["publish_formats"] = {"markdown": True, "pdf": False, "docx": False}
+    return task
+
+
+async def run_query(question: str, markdown_only: bool = False) -> dict:
+    chief_editor = ChiefEditorAgent(make_task(question, markdown_only))
+    return await chief_editor.run_research_task()
+
+
+async def score_report(
+    record: dict, router: ModelRouter, ci_width: float | None = None, sources: SourceStore | None = None
+):
+    # sources — то же хранилище, куда исследование сохранило страницы, чтобы не скрейпить их заново
+    try:
+        record["fact_score"] = await run_fact_pipeline(
+            record["report"]["report"], ci_width=ci_width, router=router, sources=sources
+        )
+    except Exception as e:
+        print(f"Fact scoring failed for {record['question']!r}: {e!r}")
+        record["fact_score_error"] = repr(e)
+
+
+async def run_queries(
+    questions: list[str],
+    concurrency: int = 4,
+    output_path: Path | None = None,
+    markdown_only: bool = False,
+    score: bool = False,
+    score_concurrency: int = 4,
+    score_ci_width: float | None = None,
+    router: ModelRouter | None = None,
+    sources: SourceStore | None = None,
+) -> list[dict]:
+    # каждый готовый отчёт сразу дописывается в output_path (JSONL), при повторном запуске
+    # с тем же output_path уже готовые вопросы пропускаются.
+    # со score=True отчёт сразу уходит в run_fact_pipeline, а следующие исследования идут параллельно
+    done = prepare_output(output_path) if output_path is not None else set()
+    research_semaphore = asyncio.Semaphore(concurrency)
+    score_semaphore = asyncio.Semaphore(score_concurrency)
+    router = router or ModelRouter()
+
+    async def score_one(record: dict) -> None:
+        async with score_semaphore:
+            await score_report(record, router, score_ci_width, sources)
+        if output_path is not None:
+            # оценка дописывается отдельной записью, read_reports сливает её с отчётом по question_hash
+            append_report(output_path, {
+                "question_hash": record["question_hash"],
+                **{key: record[key] for key in ("fact_score", "fact_score_error") if key in record},
+                "scored_at": datetime.now().isoformat(),
+            })
+
+    async def run_one(question: str) -> dict:
+        record = {"question_hash": question_hash(question), "question": question}
+        async with research_semaphore:
+            try:
+                record["report"] = await run_query(question, markdown_only)
+                record["error"] = None
+            except Exception as e:
+                # ошибка одного вопроса не должна останавливать весь прогон
+                print(f"Research failed for {question!r}: {e!r}")
+                record["error"] = repr(e)
+        record["finished_at"] = datetime.now().isoformat()
+        # отчёт записывается сразу, чтобы при падении во время оценки его не пришлось исследовать заново
+        if output_path is not None:
+            append_report(output_path, record)
+        # слот исследования уже свободен: следующий вопрос исследуется, пока этот отчёт оценивается
+        if score and record["error"] is None:
+            await score_one(record)
+        return record
+
+    unscored = []
+    if score and output_path is not None:
+        # отчёты, готовые к прошлому падению, но ещё не оценённые
+        unscored = [
+            record for record in read_reports(output_path)
+            if record.get("error") is None and "fact_score" not in record and "fact_score_error" not in record
+        ]
+        if unscored:
+            print(f"Scoring {len(unscored)} reports left unscored by the previous run")
+    todo = [question for question in questions if question_hash(question) not in done]
+    if len(todo) < len(questions):
+        print(f"Skipping {len(questions) - len(todo)} questions that are already done")
+    records, _ = await asyncio.gather(
+        asyncio.gather(*(run_one(question) for question in todo)),
+        asyncio.gather(*(score_one(record) for record in unscored)),
+    )
+    if score:
+        print(f"Fact scoring usage by model: {router.usage_report()}")
+    return records
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=4, help="сколько исследований идёт одновременно")
+    parser.add_argument(
+        "--output",
+        type=Path,
+        default=None,
+        help="JSONL с отчётами; повторный запуск с тем же файлом продолжает прерванный прогон",
+    )
+    parser.add_argument(
+        "--markdown-only",
+        action="store_true",
+        help="публиковать только markdown, pdf/docx собираются потом через publish_reports.py",
+    )
+    parser.add_argument(
+        "--sources",
+        type=Path,
+        default=SOURCES_PATH,
+        help="куда сохранять страницы, прочитанные при исследовании; fact_eval берёт их оттуда вместо повторного скрейпинга",
+    )
+    parser.add_argument("--score", action="store_true", help="сразу считать run_fact_pipeline для каждого отчёта")
+    parser.add_argument("--score-concurrency", type=int, default=4)
+    parser.add_argument(
+        "--score-ci-width",
+        type=float,
+        default=None,
+        help="оценивать valid_rate выборочно до такой ширины доверительного интервала (в п.п.)",
+    )
+    add_tracing_args(parser)
+    return parser.parse_args()
 
 
 async def main():
-    df = pd.read_json(INTERIM_DATA_PATH / "selected_questions.json", lines=True)
-    research_reports = await run_queries(df["question"].tolist())
+    args = parse_args()
+    setup_tracing_from_args(args)
+    sources = SourceStore(args.sources)
+    install_source_capture(sources)
     current_datetime = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    with open(f"data/processed/research_reports_{current_datetime}.json", "w", encoding="utf-8") as file:
-        json.dump(research_reports, file, ensure_ascii=False, indent=4)
+    output_path = args.output or DATA_PATH / "processed" / f"research_reports_{current_datetime}.jsonl"
+
+    df = pd.read_json(INTERIM_DATA_PATH / "selected_questions.json", lines=True)
+    await run_queries(
+        df["question"].tolist(),
+        concurrency=args.concurrency,
+        output_path=output_path,
+        markdown_only=args.markdown_only,
+        score=args.score,
+        score_concurrency=args.score_concurrency,
+        score_ci_width=args.score_ci_width,
+        sources=sources,
+    )
+
+    research_reports = {
+        record["question_hash"]: record["report"]
+        for record in read_reports(output_path)
+        if record.get("error") is None
+    }
+    with open(output_path.with_suffix(".json"), "w", encoding="utf-8") as file:
+        json.dump(list(research_reports.values()), file, ensure_ascii=False, indent=4, default=str)
 
     # user_input = "Проведи исследование и дай мне ответ сколько в стране людей – близнецов."
     # await run_query(user_input)
@@ -0,0 +1,125 @@
+import argparse
+import asyncio
+import multiprocessing
+import os
+import socket
+from datetime import datetime
+from pathlib import Path
+
+from dotenv import find_dotenv, load_dotenv
+
+from report_log import append_report
+from tracing import add_tracing_args, setup_tracing_from_args
+from work_queue import WorkQueue
+
+load_dotenv(find_dotenv(".env"))
+
+DATA_PATH = Path("./data")
+INTERIM_DATA_PATH = DATA_PATH / "interim"
+QUEUE_PATH = INTERIM_DATA_PATH / "research_queue.sqlite"
+
+
+async def keep_lease(queue: WorkQueue, task_id: int, worker: str, lease_seconds: float):
+    while True:
+        await asyncio.sleep(lease_seconds / 3)
+        if not queue.extend_lease(task_id, worker, lease_seconds):
+            print(f"[{worker}] lost the lease on task {task_id}")
+            return
+
+
+async def work(db_path: Path, lease_seconds: float, score: bool, markdown_only: bool, poll_seconds: float):
+    # тяжёлые импорты делаются уже в процессе воркера
+    from fact_eval.llm import ModelRouter
+    from fact_eval.sources import SourceStore, install_source_capture
+    from run_queries import run_query, score_report
+
+    sources = SourceStore()
+    install_source_capture(sources)
+    queue = WorkQueue(db_path)
+    router = ModelRouter()
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    while True:
+        row = queue.claim(worker, lease_seconds)
+        if row is None:
+            if not queue.has_work():
+                break
+            # остальные вопросы заняты другими воркерами, ждём, не истечёт ли чья-то аренда
+            await asyncio.sleep(poll_seconds)
+            continue
+
+        print(f"[{worker}] {row['question']}")
+        heartbeat = asyncio.create_task(keep_lease(queue, row["id"], worker, lease_seconds))
+        try:
+            record = {"question_hash": row["question_hash"], "question": row["question"]}
+            record["report"] = await run_query(row["question"], markdown_only)
+            record["error"] = None
+            if score:
+                await score_report(record, router, sources=sources)
+            record["finished_at"] = datetime.now().isoformat()
+            if not queue.complete(row["id"], worker, record):
+                # аренда истекла, и вопрос уже вернулся в очередь или достался другому воркеру
+                print(f"[{worker}] lease lost, result for {row['question']!r} dropped")
+        except Exception as e:
+            print(f"[{worker}] research failed for {row['question']!r}: {e!r}")
+            if not queue.fail(row["id"], worker, repr(e)):
+                print(f"[{worker}] lease lost, error for {row['question']!r} not recorded")
+        finally:
+            heartbeat.cancel()
+    if score:
+        print(f"[{worker}] fact scoring usage by model: {router.usage_report()}")
+    queue.close()
+
+
+def worker_main(args: argparse.Namespace):
+    # у каждого процесса свой tracer provider
+    setup_tracing_from_args(args)
+    asyncio.run(work(args.db, args.lease, args.score, args.markdown_only, args.poll))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Очередь вопросов в SQLite и N процессов-воркеров; на других машинах запускается "
+                    "та же команда с тем же --db на общем диске"
+    )
+    parser.add_argument("--db", type=Path, default=QUEUE_PATH)
+    parser.add_argument("--enqueue", type=Path, default=None, help="добавить вопросы, например selected_questions.json")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--lease", type=float, default=1800, help="аренда вопроса в секундах, продлевается пока воркер жив")
+    parser.add_argument("--poll", type=float, default=30)
+    parser.add_argument("--score", action="store_true", help="считать run_fact_pipeline для каждого отчёта")
+    parser.add_argument("--markdown-only", action="store_true")
+    parser.add_argument("--export", type=Path, default=None, help="выгрузить готовые результаты в JSONL")
+    add_tracing_args(parser)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    queue = WorkQueue(args.db)
+    if args.enqueue is not None:
+        import pandas as pd
+
+        df = pd.read_json(args.enqueue, lines=True)
+        print(f"Enqueued {queue.enqueue(df['question'].tolist())} new questions")
+    print(f"Requeued {queue.requeue_expired()} expired leases")
+
+    ctx = multiprocessing.get_context("spawn")
+    processes = [
+        ctx.Process(target=worker_main, args=(args,))
+        for _ in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    print(queue.stats())
+    if args.export is not None:
+        args.export.unlink(missing_ok=True)
+        for record in queue.results():
+            append_report(args.export, record)
+    queue.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+import argparse
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from dotenv import find_dotenv, load_dotenv
+
+from tracing import PROJECT_NAME, phoenix_endpoint
+
+load_dotenv(find_dotenv(".env"))
+
+SPANS_DIR = Path("./data/processed/spans")
+CURSOR_NAME = "_cursor.json"
+
+
+def _to_text(value):
+    # вложенные атрибуты (списки сообщений, документы) хранятся строкой, как в CSV из ноутбука 04
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, float) and pd.isna(value):
+        return None
+    return str(value)
+
+
+def normalize_spans(spans_df: pd.DataFrame) -> pd.DataFrame:
+    if spans_df.index.name == "context.span_id":
+        spans_df = spans_df.reset_index(drop="context.span_id" in spans_df.columns)
+    spans_df = spans_df.reset_index(drop=True)
+    for column in spans_df.columns[spans_df.dtypes == object]:
+        spans_df[column] = spans_df[column].map(_to_text)
+    spans_df["start_time"] = pd.to_datetime(spans_df["start_time"], utc=True)
+    return spans_df
+
+
+class SpanSync:
+    """Инкрементальная выгрузка спанов из Phoenix в Parquet, разбитый по дням.
+
+    Спаны запрашиваются окнами по времени старта. Окно, упёршееся в page_size, делится пополам.
+    После каждого окна в _cursor.json сохраняется high-water mark, поэтому следующий запуск
+    (и запуск после падения) забирает только новое. Окна начинаются на overlap раньше курсора,
+    чтобы не потерять спаны, которые Phoenix получил с опозданием; повторы отбрасываются по span_id.
+
+    Спан попадает в Phoenix, только когда он закончился, а окна фильтруются по времени старта, поэтому
+    курсор не заходит дальше, чем на settle_lag назад от текущего момента: последние settle_lag
+    перечитываются при каждом запуске, пока в них могут появиться долгие спаны (корни исследований,
+    графы LangGraph). settle_lag должен быть не меньше самого долгого прогона.
+    """
+
+    def __init__(
+        self,
+        client,
+        output_dir: Path = SPANS_DIR,
+        project_name: str = PROJECT_NAME,
+        window: timedelta = timedelta(hours=6),
+        page_size: int = 10_000,
+        overlap: timedelta = timedelta(minutes=10),
+        settle_lag: timedelta = timedelta(hours=3),
+        min_window: timedelta = timedelta(seconds=1),
+    ):
+        self.client = client
+        self.output_dir = Path(output_dir)
+        self.project_name = project_name
+        self.window = window
+        self.page_size = page_size
+        self.overlap = overlap
+        self.settle_lag = settle_lag
+        self.min_window = min_window
+        self.cursor_path = self.output_dir / CURSOR_NAME
+        self._known_ids = {}
+
+    def load_cursor(self) -> datetime | None:
+        if not self.cursor_path.exists():
+            return None
+        with open(self.cursor_path, "r", encoding="utf-8") as f:
+            value = json.load(f).get(self.project_name)
+        return datetime.fromisoformat(value) if value else None
+
+    def save_cursor(self, high_water_mark: datetime):
+        cursors = {}
+        if self.cursor_path.exists():
+            with open(self.cursor_path, "r", encoding="utf-8") as f:
+                cursors = json.load(f)
+        cursors[self.project_name] = high_water_mark.isoformat()
+        tmp_path = self.cursor_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(cursors, f, indent=2)
+        os.replace(tmp_path, self.cursor_path)
+
+    def fetch(self, start: datetime, end: datetime) -> list[pd.DataFrame]:
+        spans_df = self.client.query_spans(
+            project_name=self.project_name,
+            start_time=start,
+            end_time=end,
+            limit=self.page_size,
+            timeout=None,
+        )
+        if spans_df is None or spans_df.empty:
+            return []
+        if len(spans_df) < self.page_size or end - start <= self.min_window:
+            if len(spans_df) >= self.page_size:
+                print(f"[sync] {start}–{end}: {len(spans_df)} spans hit the page size, some may be missing")
+            return [spans_df]
+        middle = start + (end - start) / 2
+        return self.fetch(start, middle) + self.fetch(middle, end)
+
+    def partition_dir(self, day) -> Path:
+        return self.output_dir / f"date={day}"
+
+    def known_ids(self, day) -> set:
+        # span_id уже записанных спанов дня читаются одной колонкой и кэшируются на время запуска
+        if day not in self._known_ids:
+            directory = self.partition_dir(day)
+            ids = set()
+            for path in sorted(directory.glob("*.parquet")) if directory.exists() else []:
+                ids.update(pq.read_table(path, columns=["context.span_id"]).column(0).to_pylist())
+            self._known_ids[day] = ids
+        return self._known_ids[day]
+
+    def write(self, spans_df: pd.DataFrame) -> int:
+        spans_df = normalize_spans(spans_df)
+        written = 0
+        for day, day_df in spans_df.groupby(spans_df["start_time"].dt.date):
+            known = self.known_ids(day)
+            day_df = day_df.loc[~day_df["context.span_id"].isin(known)]
+            day_df = day_df.drop_duplicates("context.span_id", keep="last")
+            if day_df.empty:
+                continue
+            schema = pa.Schema.from_pandas(day_df, preserve_index=False)
+            # колонки, пустые в этом окне, всё равно строковые, а целые — float64, как в окнах, где в них есть NaN,
+            # чтобы схемы частей совпадали
+            for i, field in enumerate(schema):
+                if pa.types.is_null(field.type):
+                    schema = schema.set(i, field.with_type(pa.string()))
+                elif pa.types.is_integer(field.type):
+                    schema = schema.set(i, field.with_type(pa.float64()))
+            table = pa.Table.from_pandas(day_df, schema=schema, preserve_index=False)
+
+            directory = self.partition_dir(day)
+            directory.mkdir(parents=True, exist_ok=True)
+            path = directory / f"part-{datetime.now().strftime('%Y%m%d%H%M%S%f')}.parquet"
+            # файлы с точкой в начале pyarrow.dataset пропускает, недописанная часть не прочитается
+            tmp_path = directory / f".{path.name}"
+            pq.write_table(table, tmp_path)
+            os.replace(tmp_path, path)
+            known.update(day_df["context.span_id"])
+            written += len(day_df)
+        return written
+
+    def sync(self, since: datetime | None = None, until: datetime | None = None) -> int:
+        cursor = self.load_cursor()
+        if cursor is not None:
+            start = cursor - self.overlap
+        elif since is not None:
+            start = since
+        else:
+            raise ValueError("no cursor yet, pass the start of the first sync")
+        now = datetime.now(timezone.utc)
+        until = until or now
+        # спаны, начавшиеся позже settled, ещё могут прийти, курсор дальше не сдвигается
+        settled = now - self.settle_lag
+
+        total = 0
+        while start < until:
+            end = min(start + self.window, until)
+            frames = self.fetch(start, end)
+            written = sum(self.write(spans_df) for spans_df in frames)
+            total += written
+            print(f"[sync] {start:%Y-%m-%d %H:%M}–{end:%Y-%m-%d %H:%M}: {written} new spans")
+            if cursor is None or min(end, settled) > cursor:
+                cursor = min(end, settled)
+                self.save_cursor(cursor)
+            start = end
+        return total
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Выгрузить новые спаны из Phoenix в Parquet по дням")
+    parser.add_argument("--endpoint", default=phoenix_endpoint())
+    parser.add_argument("--project", default=PROJECT_NAME)
+    parser.add_argument("--output", type=Path, default=SPANS_DIR)
+    parser.add_argument(
+        "--since",
+        type=datetime.fromisoformat,
+        default=None,
+        help="начало первой выгрузки, например 2025-07-15; дальше используется сохранённый курсор",
+    )
+    parser.add_argument("--until", type=datetime.fromisoformat, default=None)
+    parser.add_argument("--window-hours", type=float, default=6)
+    parser.add_argument("--page-size", type=int, default=10_000)
+    parser.add_argument("--overlap-minutes", type=float, default=10)
+    parser.add_argument(
+        "--settle-hours",
+        type=float,
+        default=3,
+        help="последние часы перечитываются при каждом запуске, пока не закончатся долгие спаны; не меньше самого долгого прогона",
+    )
+    return parser.parse_args()
+
+
+def _as_utc(value: datetime | None) -> datetime | None:
+    if value is None or value.tzinfo is not None:
+        return value
+    return value.replace(tzinfo=timezone.utc)
+
+
+def main():
+    import phoenix as px
+
+    args = parse_args()
+    sync = SpanSync(
+        px.Client(endpoint=args.endpoint),
+        output_dir=args.output,
+        project_name=args.project,
+        window=timedelta(hours=args.window_hours),
+        page_size=args.page_size,
+        overlap=timedelta(minutes=args.overlap_minutes),
+        settle_lag=timedelta(hours=args.settle_hours),
+    )
+    total = sync.sync(_as_utc(args.since), _as_utc(args.until))
+    print(f"Готово: {total} новых спанов в {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+
+PROJECT_NAME = "gpt-researcher"
+DEFAULT_PHOENIX_ENDPOINT = "http://localhost:6006"
+TRACES_PATH = Path("./data/traces")
+TRACING_MODES = ("off", "phoenix", "file")
+
+
+def phoenix_endpoint() -> str:
+    # читается при вызове, а не при импорте: скрипты загружают .env уже после импорта tracing
+    return os.getenv("PHOENIX_COLLECTOR_ENDPOINT", DEFAULT_PHOENIX_ENDPOINT)
+
+
+class OTLPJsonFileExporter:
+    """Writes spans as OTLP/JSON lines (one ExportTraceServiceRequest per line) instead of sending them.
+
+    The files can be loaded into Phoenix or any OTLP collector later.
+    """
+
+    def __init__(self, directory: Path = TRACES_PATH):
+        directory.mkdir(parents=True, exist_ok=True)
+        self.path = directory / f"spans_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}_{os.getpid()}.jsonl"
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def export(self, spans):
+        from google.protobuf.json_format import MessageToJson
+        from opentelemetry.exporter.otlp.proto.common.trace_encoder import encode_spans
+        from opentelemetry.sdk.trace.export import SpanExportResult
+
+        line = MessageToJson(encode_spans(spans), indent=None)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+        return SpanExportResult.SUCCESS
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        with self._lock:
+            self._file.flush()
+        return True
+
+    def shutdown(self):
+        with self._lock:
+            self._file.close()
+
+
+def setup_tracing(
+    mode: str = "phoenix",
+    sample_rate: float = 1.0,
+    endpoint: str | None = None,
+    traces_path: Path = TRACES_PATH,
+    project_name: str = PROJECT_NAME,
+):
+    # opentelemetry и phoenix импортируются только если трассировка включена.
+    # BatchSpanProcessor отправляет спаны в фоне пачками: медленный или недоступный phoenix
+    # не тормозит и не роняет прогон, спаны просто теряются с предупреждением в логе
+    if mode == "off":
+        return None
+    if mode not in TRACING_MODES:
+        raise ValueError(f"unknown tracing mode: {mode!r}, expected one of {TRACING_MODES}")
+
+    from openinference.instrumentation.langchain import LangChainInstrumentor
+    from openinference.semconv.resource import ResourceAttributes
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+
+    if mode == "phoenix":
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+
+        endpoint = endpoint or phoenix_endpoint()
+        exporter = OTLPSpanExporter(endpoint=f"{endpoint.rstrip('/')}/v1/traces")
+    else:
+        exporter = OTLPJsonFileExporter(traces_path)
+
+    tracer_provider = TracerProvider(
+        resource=Resource.create({ResourceAttributes.PROJECT_NAME: project_name}),
+        sampler=ParentBased(TraceIdRatioBased(sample_rate)),
+    )
+    tracer_provider.add_span_processor(BatchSpanProcessor(exporter))
+    LangChainInstrumentor().instrument(tracer_provider=tracer_provider)
+    return tracer_provider
+
+
+def add_tracing_args(parser):
+    parser.add_argument(
+        "--tracing",
+        choices=TRACING_MODES,
+        default=os.getenv("TRACING", "phoenix"),
+        help="phoenix — отправлять спаны в phoenix, file — писать OTLP/JSON в --traces-dir, off — без трассировки",
+    )
+    parser.add_argument("--trace-sample-rate", type=float, default=float(os.getenv("TRACE_SAMPLE_RATE", "1.0")))
+    parser.add_argument("--phoenix-endpoint", default=phoenix_endpoint())
+    parser.add_argument("--traces-dir", type=Path, default=TRACES_PATH)
+
+
+def setup_tracing_from_args(args):
+    return setup_tracing(
+        mode=args.tracing,
+        sample_rate=args.trace_sample_rate,
+        endpoint=args.phoenix_endpoint,
+        traces_path=args.traces_dir,
+    )
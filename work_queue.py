@@ -0,0 +1,127 @@
+import json
+import sqlite3
+import time
+from pathlib import Path
+
+from report_log import question_hash
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY,
+    question_hash TEXT UNIQUE NOT NULL,
+    question TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_expires REAL,
+    result TEXT,
+    error TEXT,
+    updated_at REAL
+);
+CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, lease_expires);
+"""
+
+
+class WorkQueue:
+    """Durable question queue in SQLite, shared by worker processes on one or several machines.
+
+    A worker claims a question with a lease and extends it while it works; questions whose lease
+    expired (the worker died) go back to 'pending', and after max_attempts a question is 'failed'.
+    The default rollback journal is used instead of WAL, so that the file can live on a shared disk.
+    """
+
+    def __init__(self, db_path: Path, max_attempts: int = 3):
+        self.db_path = Path(db_path)
+        self.max_attempts = max_attempts
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.db_path, timeout=60, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def enqueue(self, questions: list[str]) -> int:
+        now = time.time()
+        with self.conn:
+            cursor = self.conn.executemany(
+                "INSERT OR IGNORE INTO tasks (question_hash, question, updated_at) VALUES (?, ?, ?)",
+                [(question_hash(question), question, now) for question in questions],
+            )
+        return cursor.rowcount
+
+    def requeue_expired(self) -> int:
+        with self.conn:
+            return self._requeue_expired()
+
+    def _requeue_expired(self) -> int:
+        # a question whose worker died on its last attempt is failed, claim would never pick it up again
+        return self.conn.execute(
+            "UPDATE tasks SET status = CASE WHEN attempts < ? THEN 'pending' ELSE 'failed' END, "
+            "error = CASE WHEN attempts < ? THEN error ELSE COALESCE(error, 'lease expired') END, "
+            "worker = NULL, updated_at = ? "
+            "WHERE status = 'leased' AND lease_expires < ?",
+            (self.max_attempts, self.max_attempts, time.time(), time.time()),
+        ).rowcount
+
+    def claim(self, worker: str, lease_seconds: float) -> sqlite3.Row | None:
+        # BEGIN IMMEDIATE takes the write lock, so two workers never claim the same question
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._requeue_expired()
+            row = self.conn.execute(
+                "SELECT id, question_hash, question, attempts FROM tasks "
+                "WHERE status = 'pending' AND attempts < ? ORDER BY id LIMIT 1",
+                (self.max_attempts,),
+            ).fetchone()
+            if row is not None:
+                self.conn.execute(
+                    "UPDATE tasks SET status = 'leased', worker = ?, attempts = attempts + 1, "
+                    "lease_expires = ?, updated_at = ? WHERE id = ?",
+                    (worker, time.time() + lease_seconds, time.time(), row["id"]),
+                )
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        return row
+
+    def extend_lease(self, task_id: int, worker: str, lease_seconds: float) -> bool:
+        with self.conn:
+            return self.conn.execute(
+                "UPDATE tasks SET lease_expires = ?, updated_at = ? "
+                "WHERE id = ? AND worker = ? AND status = 'leased'",
+                (time.time() + lease_seconds, time.time(), task_id, worker),
+            ).rowcount == 1
+
+    def complete(self, task_id: int, worker: str, result: dict) -> bool:
+        with self.conn:
+            return self.conn.execute(
+                "UPDATE tasks SET status = 'done', result = ?, error = NULL, lease_expires = NULL, updated_at = ? "
+                "WHERE id = ? AND worker = ? AND status = 'leased'",
+                (json.dumps(result, ensure_ascii=False, default=str), time.time(), task_id, worker),
+            ).rowcount == 1
+
+    def fail(self, task_id: int, worker: str, error: str) -> bool:
+        with self.conn:
+            return self.conn.execute(
+                "UPDATE tasks SET status = CASE WHEN attempts < ? THEN 'pending' ELSE 'failed' END, "
+                "error = ?, worker = NULL, lease_expires = NULL, updated_at = ? "
+                "WHERE id = ? AND worker = ? AND status = 'leased'",
+                (self.max_attempts, error, time.time(), task_id, worker),
+            ).rowcount == 1
+
+    def stats(self) -> dict[str, int]:
+        rows = self.conn.execute("SELECT status, COUNT(*) AS n FROM tasks GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+    def has_work(self) -> bool:
+        row = self.conn.execute(
+            "SELECT COUNT(*) AS n FROM tasks WHERE status = 'leased' OR (status = 'pending' AND attempts < ?)",
+            (self.max_attempts,),
+        ).fetchone()
+        return row["n"] > 0
+
+    def results(self) -> list[dict]:
+        rows = self.conn.execute("SELECT result FROM tasks WHERE status = 'done' ORDER BY id").fetchall()
+        return [json.loads(row["result"]) for row in rows]